@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import random
+
+from FloorPlan import FloorPlan
+from GridGraph import PathTable
+from XdockParams import get_distance_city_block, get_path_len
+
+from ModelParameters import ModelParams as M
+
+N_QUERY = 1000
+
+
+def time_queries(name, get_path, pairs):
+    t0 = time.perf_counter()
+    len_list = [get_path_len(get_path(c1, c2)) for (c1, c2) in pairs]
+    dt = time.perf_counter() - t0
+    print(f"{name:32s}: {1.e6*dt/len(pairs):8.1f} us/query")
+    return len_list
+
+
+def get_external_graph_tools():
+    # The external GraphTools module, in its original location next to this repository (if present)
+    parentdir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.path.insert(0, os.path.join(parentdir, "dks-ketenrekenmodel", "src", "krm", "core"))
+    try:
+        import GraphTools
+    except ImportError:
+        return None
+    return GraphTools
+
+
+def main():
+    M().set_path_cache(False)
+    t0 = time.perf_counter()
+    fp = FloorPlan(headless=True)
+    graph = fp.grid_graph
+    graph.compile()
+    print(f"floor plan with {graph.get_n_nodes()} vertices: {time.perf_counter()-t0:.2f} s")
+
+    random.seed(0)
+    pos_list = [(rob.default_pos.w, rob.default_pos.h) for rob in fp.robots]
+    pairs    = [(random.choice(graph.node_list), random.choice(graph.node_list)) for _ in range(N_QUERY)]
+    pairs_pt = [(random.choice(pos_list),       random.choice(graph.node_list)) for _ in range(N_QUERY)]
+
+    len_astar = time_queries("GridGraph A*", graph.get_shortest_path, pairs)
+    time_queries("GridGraph Dijkstra", lambda c1, c2: graph.get_shortest_path(c1, c2, astar=False), pairs)
+
+    # Expanded vertices per query, with and without heuristic
+    n_expanded = [0, 0]
+    for (c1, c2) in pairs:
+        for k, astar in enumerate([True, False]):
+            graph.get_shortest_path(c1, c2, astar=astar)
+            n_expanded[k] += graph.n_expanded
+    print(f"expanded vertices per query: A* {n_expanded[0]/N_QUERY:.1f}, Dijkstra {n_expanded[1]/N_QUERY:.1f}")
+
+    path_table = PathTable(graph, pos_list, get_distance_city_block)
+    time_queries("GridGraph PathTable (cold)", path_table.get_path, pairs_pt)
+    time_queries("GridGraph PathTable (warm)", path_table.get_path, pairs_pt)
+    len_matrix = time_queries("PathMatrix", fp.path_matrix.get_path, pairs)
+
+    GT = get_external_graph_tools()
+    if GT is None:
+        print("GraphTools not found: no comparison with the external module")
+        return
+
+    gt_graph = GT.DiGraph()
+    for (p1, p2) in graph.get_edge_list():
+        gt_graph.add_edge(p1, p2)
+    len_gt = time_queries("GraphTools", lambda c1, c2: gt_graph.get_shortest_path(c1, c2, get_distance_city_block), pairs)
+
+    n_diff = sum(abs(l1-l2)>1.e-6 for (l1, l2) in zip(len_gt, len_astar))
+    n_diff += sum(abs(l1-l2)>1.e-6 for (l1, l2) in zip(len_gt, len_matrix))
+    print(f"path lengths different from GraphTools: {n_diff}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
-import cv2 as cv
+import math
 from collections import namedtuple
 
+import numpy as np
+
 from XdockParams import round_coords, \
                       W_DOCK, H_FRONT, \
                       W_LANE, N_LANE, H_LANE_STORE, \
@@ -11,23 +13,125 @@ from ModelParameters import ModelParams as M
 
 RollContainerIO = namedtuple("rc_in_out", "eta lane roll_container")
 
+class BufferLaneArray:
+    """
+        State of all buffer lanes of the floor plan, with lane index k = dock*N_LANE + lane:
+        n_stored[k], n_reserved[k]         : number of roll containers in the lane and of reserved places
+        dead_time_up[k], dead_time_down[k] : time since the lane was loaded or unloaded (negative while it is busy)
+        anchor_step[k,r], anchor_h[k,r]    : time step and h coordinate from which roll container r moves (see get_heights())
+        h_stop[k,r]                        : h coordinate where roll container r is blocked (its store position)
+        h_unload[k]                        : h coordinate where the first roll container can be unloaded
+    """
+    def __init__(self):
+        n_lane              = M.N_DOCK*N_LANE
+        self.n_step         = 0  # time steps since the start of the simulation
+        self.lane_up        = np.zeros(n_lane, bool)
+        self.n_stored       = np.zeros(n_lane, int)
+        self.n_reserved     = np.zeros(n_lane, int)
+        self.dead_time_up   = np.zeros(n_lane)
+        self.dead_time_down = np.zeros(n_lane)
+        self.anchor_step    = np.zeros((n_lane, M.MAX_LANE_STORE), int)
+        self.anchor_h       = np.zeros((n_lane, M.MAX_LANE_STORE))
+        self.h_stop         = np.zeros((n_lane, M.MAX_LANE_STORE))
+        self.h_unload       = np.zeros(n_lane)
+
+    def get_heights(self):
+        """
+            return h coordinates of the roll containers of all lanes [k,r], with NaN for empty store positions.
+            Each roll container moves with BUFFER_LANE_SPEED from its anchor until it is blocked at its store position,
+            behind the roll containers in front of it. Its anchor is its entry position, or the position where it was
+            when the roll container in front of it was picked up.
+        """
+        move = M.BUFFER_LANE_SPEED * TIME_STEP_S * (self.n_step-self.anchor_step)
+        h    = np.where(self.lane_up[:,None], np.minimum(self.anchor_h+move, self.h_stop),
+                                              np.maximum(self.anchor_h-move, self.h_stop))
+        return np.where(np.arange(M.MAX_LANE_STORE)<self.n_stored[:,None], h, np.nan)
+
+    def get_lane_heights(self, k):
+        # h coordinates of the roll containers in lane k (same as the first n_stored[k] of get_heights()[k])
+        n    = self.n_stored[k]
+        move = M.BUFFER_LANE_SPEED * TIME_STEP_S * (self.n_step-self.anchor_step[k,:n])
+        if self.lane_up[k]: return np.minimum(self.anchor_h[k,:n]+move, self.h_stop[k,:n])
+        else:               return np.maximum(self.anchor_h[k,:n]-move, self.h_stop[k,:n])
+
+    def get_front_height(self, k):
+        # h coordinate of the first roll container of lane k
+        move = M.BUFFER_LANE_SPEED * TIME_STEP_S * (self.n_step-self.anchor_step[k,0])
+        if self.lane_up[k]: return min(self.anchor_h[k,0]+move, self.h_stop[k,0])
+        else:               return max(self.anchor_h[k,0]-move, self.h_stop[k,0])
+
+    def time_step(self):
+        self.skip_steps(1)
+
+    def skip_steps(self, n_step):
+        self.n_step         += n_step
+        self.dead_time_up   += TIME_STEP_S * n_step
+        self.dead_time_down += TIME_STEP_S * n_step
+
+    def get_n_idle_steps(self):
+        """
+            return number of time steps before any lane can be loaded or unloaded again
+        """
+        n_step = math.inf
+        for dead_time in (self.dead_time_up, self.dead_time_down):
+            busy = dead_time<0.
+            if busy.any():
+                n_step = min(n_step, int(np.floor(-dead_time[busy]/TIME_STEP_S).min()))
+
+        # first roll container of an outgoing lane has to reach the dock
+        h_front = self.get_heights()[:,0]
+        moving  = ~self.lane_up & (self.n_stored>0) & (h_front>self.h_unload)
+        if moving.any():
+            n_step = min(n_step, int(np.floor((h_front[moving]-self.h_unload[moving])/(M.BUFFER_LANE_SPEED*TIME_STEP_S)).min()))
+        return n_step
+
+    def is_settled(self):
+        # all roll containers at their final position
+        h      = self.get_heights()
+        stored = ~np.isnan(h)
+        return bool(np.all(h[stored]==self.h_stop[stored]))
+
+    def get_best_lane(self, dock, output=True, loading=True):
+        """
+            return the least reserved lane of dock for loading, or the fullest lane for unloading (-1 if there is none).
+            Only lanes in the given direction (output: down to the dock) are considered; ties go to the lowest lane.
+        """
+        k     = slice(dock*N_LANE, (dock+1)*N_LANE)
+        valid = self.lane_up[k]!=output
+        if loading:
+            valid &= self.n_reserved[k]<M.MAX_LANE_STORE
+            if not valid.any(): return -1
+            return int(np.argmin(np.where(valid, self.n_reserved[k], M.MAX_LANE_STORE)))
+        else:
+            n_stored = np.where(valid, self.n_stored[k], 0)
+            lane     = int(np.argmax(n_stored))
+            return lane if n_stored[lane]>0 else -1
+
+    def get_n_incoming(self, dock):
+        k = slice(dock*N_LANE, (dock+1)*N_LANE)
+        return int(self.n_stored[k][self.lane_up[k]].sum())
+
+
 class BufferLane:
-    def __init__(self, dock, lane):
+    """
+        One buffer lane, with its roll containers in store and its other state in a BufferLaneArray.
+    """
+    def __init__(self, dock, lane, lane_array):
         if dock<0 or M.N_DOCK<=dock: return
         if lane<0 or   N_LANE<=lane: return
 
         self.lane_up = lane>=N_LANE/2
         self.dock    = dock
         self.lane    = lane
+        self.k       = dock*N_LANE + lane
+        self.lanes   = lane_array
 
         self.w1 = (W_DOCK/N_LANE-W_LANE)/2 + self.lane*W_DOCK/N_LANE + dock * W_DOCK
         self.w2 = self.w1 + W_LANE
         self.h1 = H_FRONT
         self.h2 = self.h1 + M.H_LANE
 
-        self.dead_time_up   = 0.
-        self.dead_time_down = 0.
-        self.store          = []
+        self.store = []
         mid  = (self.w1 + self.w2) / 2
         step = (self.h2 - self.h1 - H_LANE_STORE) / (M.MAX_LANE_STORE - 1)
         if self.lane_up:
@@ -38,40 +142,41 @@ class BufferLane:
         self.w1, self.h1 = round_coords((self.w1, self.h1))
         self.w2, self.h2 = round_coords((self.w2, self.h2))
 
-        self.n_store_reserved = 0
+        lane_array.lane_up [self.k] = self.lane_up
+        lane_array.h_stop  [self.k] = [self.store_coord_dict[M.MAX_LANE_STORE-1-r][1] for r in range(M.MAX_LANE_STORE)]
+        lane_array.h_unload[self.k] = self.h1+H_LANE_STORE/2
 
     def __str__(self):
         text  = f"lane_up  = {str(self.lane_up):s} \n"
         text += f"dock     = {self.dock:d} \n"
         text += f"lane     = {self.lane:d}\n"
-        text += f"n_store_reserved = {self.n_store_reserved:d}\n"
+        text += f"n_store_reserved = {self.get_n_reserved():d}\n"
         text += f"n_stored = {len(self.store):d}\n"
         return text
 
-    def get_expected_roll_containers(self):
+    def get_expected_roll_containers(self, scheduled=True):
         """
             return list of expected roll containers as tuples:
             (expected time of availability, lane, roll container)
+            Roll containers that are already scheduled are skipped if scheduled is False.
         """
-        return [RollContainerIO((self.store_coord_dict[M.MAX_LANE_STORE-1][1]-rol.h)/M.BUFFER_LANE_SPEED, self.lane, rol) for rol in self.store]
+        if len(self.store)==0: return []
+        if not scheduled and all(rol.scheduled for rol in self.store): return []
 
-    def time_step(self):
-        move = M.BUFFER_LANE_SPEED * TIME_STEP_S
-        if self.lane_up:
-            for r, rol in enumerate(self.store):
-                rol.h = min(rol.h+move, self.store_coord_dict[M.MAX_LANE_STORE-1-r][1])
-        else:
-            for r, rol in enumerate(self.store):
-                rol.h = max(rol.h-move, self.store_coord_dict[M.MAX_LANE_STORE-1-r][1])
+        h_top = self.store_coord_dict[M.MAX_LANE_STORE-1][1]
+        eta   = ((h_top-self.lanes.get_lane_heights(self.k))/M.BUFFER_LANE_SPEED).tolist()
+        return [RollContainerIO(eta[r], self.lane, rol) for r, rol in enumerate(self.store) if scheduled or not rol.scheduled]
 
-        self.dead_time_up   += TIME_STEP_S
-        self.dead_time_down += TIME_STEP_S
+    def update_positions(self):
+        # set the coordinates of the roll containers in store, for drawing
+        for rol, h in zip(self.store, self.lanes.get_lane_heights(self.k).tolist()):
+            rol.h = h
 
     def can_be_loaded(self):
-        return len(self.store)<M.MAX_LANE_STORE and self.dead_time_up>=0.
+        return len(self.store)<M.MAX_LANE_STORE and self.lanes.dead_time_up[self.k]>=0.
 
     def can_be_unloaded(self):
-        return len(self.store)>0 and self.store[0].h<=self.h1+H_LANE_STORE/2 and self.dead_time_down>=0.
+        return len(self.store)>0 and self.lanes.dead_time_down[self.k]>=0. and self.lanes.get_front_height(self.k)<=self.lanes.h_unload[self.k]
 
     def get_grid_coords(self):
         # return top store
@@ -79,6 +184,7 @@ class BufferLane:
         else:            return self.store_coord_dict[0]
 
     def draw(self, floor_plan):
+        import cv2 as cv
         # draw box
         pt1 = floor_plan.pnt_from_coords(self.w1, self.h1)
         pt2 = floor_plan.pnt_from_coords(self.w2, self.h2)
@@ -94,28 +200,42 @@ class BufferLane:
         else:
             floor_plan.figure = cv.arrowedLine(floor_plan.figure, pt2, pt1, (100, 0, 0), 3)
 
+        self.update_positions()
         for rol in self.store:
             rol.draw(floor_plan)
 
     def get_n_stored(self):
         return len(self.store)
 
+    def get_n_reserved(self):
+        return int(self.lanes.n_reserved[self.k])
+
     def reserve_store(self):
-        self.n_store_reserved += 1
+        self.lanes.n_reserved[self.k] += 1
 
     def store_roll_container(self, rol):
         if len(self.store)>=M.MAX_LANE_STORE: return
 
         rol.w, rol.h = self.store_coord_dict[0]
         rol.o = 1 if self.lane_up else 3
+        r     = len(self.store)
         self.store.append(rol)
+        self.lanes.n_stored   [self.k]   = len(self.store)
+        self.lanes.anchor_step[self.k,r] = self.lanes.n_step
+        self.lanes.anchor_h   [self.k,r] = rol.h
         if self.lane_up:
-            self.dead_time_up =-M.TIME_LOAD_BUFFER_LANE
+            self.lanes.dead_time_up[self.k] =-M.TIME_LOAD_BUFFER_LANE
 
     def pickup_roll_container(self):
         if len(self.store)>0:
-            self.n_store_reserved -= 1
+            self.lanes.n_reserved[self.k] -= 1
             if not self.lane_up:
-                self.dead_time_down =-M.TIME_LOAD_BUFFER_LANE
+                self.lanes.dead_time_down[self.k] =-M.TIME_LOAD_BUFFER_LANE
+
+            # the roll containers behind it move on from where they are now
+            n = len(self.store)
+            self.lanes.anchor_h   [self.k,:n-1] = self.lanes.get_lane_heights(self.k)[1:]
+            self.lanes.anchor_step[self.k,:n-1] = self.lanes.n_step
+            self.lanes.n_stored   [self.k]      = n-1
             return self.store.pop(0)
-        print("ERROR: BufferLane.pickup_roll_container(). Store empty.\n", str(self))
\ No newline at end of file
+        print("ERROR: BufferLane.pickup_roll_container(). Store empty.\n", str(self))
@@ -1,18 +1,100 @@
-import cv2 as cv
+import math
+
+import numpy as np
+
 from XdockParams import round_coord, round_coords, \
                       W_DOCK, H_FRONT, H_RIGHT, H_LEFT,\
                       W_BUFFER_COMP, H_BUFFER_COMP, \
+                      LOG_INTERVAL_STORE, \
                       BLACK
 
 from ModelParameters import ModelParams as M
 
-from SimulationConfig import destination_color_dict, PRIO_LIST
-from Robot import BSM
+from SimulationConfig import destination_color_dict, PRIO_LIST, MAX_PRIO, DESTINATIONS, get_output_dock, \
+                             destination_from_dock, prio_from_dock
+
+# States of the places in a buffer store
+SLOT_FREE      = 0
+SLOT_RESERVED  = 1  # reserved for a roll container that is on its way
+SLOT_STORED    = 2
+SLOT_SCHEDULED = 3  # stored and scheduled for pickup
+
+class BufferStoreArray:
+    """
+        State of all places of all buffer stores, as arrays [dock, buffer, row, col] (col: position in the row):
+        state[d,b,r,c] : one of SLOT_FREE, SLOT_RESERVED, SLOT_STORED, SLOT_SCHEDULED
+        dest[d,b,r,c]  : destination code of the stored roll container (its output dock, see get_output_dock()), or -1
+        Kept up to date by the BufferStoreRows, for queries over all stores at once.
+    """
+    def __init__(self, context):
+        shape       = (M.N_DOCK, M.N_BUFFER_STORE, M.N_BUFFER_ROW, M.N_BUFFER_COL)
+        self.n_code = len(DESTINATIONS)*MAX_PRIO
+        self.state  = np.zeros(shape, np.int8)
+        self.dest   = np.full (shape, -1, np.int16)
+
+        self.context  = context  # SimulationContext, for the log file name
+        self.log_file = ""
+        self.t_log    = 0.  # time of the next log line
+
+    def get_n_stored(self):
+        return int(np.count_nonzero(self.state>=SLOT_STORED))
+
+    def get_n_free(self, stores=None):
+        # number of free places in all stores or in the list of stores (dock, buffer)
+        if stores is None: return int(np.count_nonzero(self.state==SLOT_FREE))
+        if len(stores)==0: return 0
+        docks, buffers = zip(*stores)
+        return int(np.count_nonzero(self.state[list(docks), list(buffers)]==SLOT_FREE))
+
+    def get_n_stored_per_code(self, scheduled=None):
+        # number of roll containers in store for each destination code, only (not) scheduled ones if scheduled is given
+        if   scheduled is None: stored = self.state>=SLOT_STORED
+        elif scheduled        : stored = self.state==SLOT_SCHEDULED
+        else                  : stored = self.state==SLOT_STORED
+        return np.bincount(self.dest[stored], minlength=self.n_code)
+
+    def get_nearest_store(self, dest, prio, dock, scheduled=False):
+        """
+            return (dock, buffer) of the store nearest to dock with (not) scheduled roll containers of dest and prio,
+            or None. Of equally distant docks the left one is taken, and of its stores the lowest one.
+        """
+        state = SLOT_SCHEDULED if scheduled else SLOT_STORED
+        found = ((self.state==state) & (self.dest==get_output_dock(dest, prio))).any(axis=(2, 3))
+        docks, buffers = np.nonzero(found)
+        if len(docks)==0: return None
+
+        n = np.argmin(2*np.abs(docks-dock) + (docks>dock))  # first in nonzero order: lowest buffer
+        return int(docks[n]), int(buffers[n])
+
+    def log(self, time_sec):
+        """
+            Write the occupancy of the stores to the log file for each LOG_INTERVAL_STORE seconds up to time_sec, with
+            the current state (which does not change between events).
+        """
+        if self.log_file=="":
+            self.log_file = self.context.get_log_filename("Stores")
+            self.t_log    = LOG_INTERVAL_STORE * math.ceil(time_sec/LOG_INTERVAL_STORE)
+            with open(self.log_file, "w") as fp:
+                fp.write("time\tfree\treserved\tstored\tscheduled\t" +
+                         '\t'.join(destination_from_dock(code)+"-"+prio_from_dock(code) for code in range(self.n_code)) + '\n')
+        if self.t_log>time_sec: return
+
+        n_state = np.bincount(self.state.ravel(), minlength=SLOT_SCHEDULED+1).tolist()
+        line    = '\t'.join(f"{n:d}" for n in n_state + self.get_n_stored_per_code().tolist())
+        with open(self.log_file, "a") as fp:
+            while self.t_log<=time_sec:
+                fp.write(f"{self.t_log/3600.:9.3f}\t" + line + '\n')
+                self.t_log += LOG_INTERVAL_STORE
 
 class BufferStoreRow:
+    """
+        One row of a buffer store. Changes of its reservations and roll containers are counted in its parent store.
+    """
     def __init__(self, w_dict, h, row, parent):
         self.n_store_reserved = 0 # number of places reserved for storage
+        self.n_not_scheduled  = 0 # number of roll containers not scheduled for pickup
         self.row              = row
+        self.bit              = 1<<row  # bit of the row in the row masks of the parent
         self.parent           = parent
         self.store            = []
         self.w_dict           = w_dict
@@ -28,7 +110,12 @@ class BufferStoreRow:
         return len(self.store)
 
     def reserve_store(self):
-        self.n_store_reserved += 1
+        self.n_store_reserved  += 1
+        self.parent.n_reserved += 1
+        if self.n_store_reserved>=M.N_BUFFER_COL:
+            self.parent.available_rows &= ~self.bit
+        self.parent.update_manager()
+        self.__update_array()
 
     def is_store_available(self):
         return self.n_store_reserved<M.N_BUFFER_COL
@@ -45,33 +132,68 @@ class BufferStoreRow:
         rol.o = 2
 
         self.store.append(rol)
+        self.parent.n_stored += 1
+        if not rol.scheduled:
+            self.__add_not_scheduled(1)
+
         self.store.sort(key=lambda r:r.scheduled)
         for col, rol in enumerate(self.store):
             rol.w = self.w_dict[col]
+        self.__update_array()
+
+    def __update_array(self):
+        # Copy the state of the row to the store array of the floor plan
+        array    = self.parent.store_array
+        if array is None: return
+
+        n        = len(self.store)
+        k        = (self.parent.dock, self.parent.buffer, self.row)
+        state    = [SLOT_SCHEDULED if rol.scheduled else SLOT_STORED for rol in self.store] + \
+                   [SLOT_RESERVED]*(min(self.n_store_reserved, M.N_BUFFER_COL)-n) + [SLOT_FREE]*(M.N_BUFFER_COL-max(n, self.n_store_reserved))
+        array.state[k] = state
+        array.dest [k] = [get_output_dock(rol.dest, rol.prio) for rol in self.store] + [-1]*(M.N_BUFFER_COL-n)
+
+    def __add_not_scheduled(self, n):
+        self.n_not_scheduled += n
+        if self.n_not_scheduled>0: self.parent.not_scheduled_rows |=  self.bit
+        else:                      self.parent.not_scheduled_rows &= ~self.bit
 
     def get_n_not_scheduled(self):
-        return len([r for r in self.store if not r.scheduled])
+        return self.n_not_scheduled
 
     def schedule_roll_container(self):
         for c, rol in enumerate(reversed(self.store)):
             if rol.scheduled: continue
             rol.scheduled = True
+            self.__add_not_scheduled(-1)
+            self.__update_array()
             return M.N_BUFFER_COL - 1 - c
         return -1
 
     def pickup_roll_container(self):
         if len(self.store)>0:
-            self.n_store_reserved -= 1
-            return self.store.pop(-1)
+            self.n_store_reserved  -= 1
+            self.parent.n_reserved -= 1
+            self.parent.available_rows |= self.bit
+            self.parent.update_manager()
+
+            rol = self.store.pop(-1)
+            self.parent.n_stored -= 1
+            if not rol.scheduled:
+                self.__add_not_scheduled(-1)
+            self.__update_array()
+            return rol
         print("ERROR: BufferStoreRow.pickup_roll_container(). Store empty.\n", str(self))
 
 class BufferStore:
-    def __init__(self, dock, buffer):
+    def __init__(self, dock, buffer, store_array=None, manager=None):
         if dock<0   or M.N_DOCK<=dock: return
         if buffer<0 or M.N_BUFFER_STORE<=buffer: return
 
-        self.dock   = dock
-        self.buffer = buffer
+        self.dock        = dock
+        self.buffer      = buffer
+        self.store_array = store_array
+        self.manager     = manager  # BufferStoreManager, told about changes of the reservations
 
         self.w1 = dock * W_DOCK + (M.W_DOWN + W_DOCK - M.W_UP - M.W_BUFFER_STORE) / 2
         self.w2 = self.w1 + M.W_BUFFER_STORE
@@ -91,6 +213,12 @@ class BufferStore:
         self.w1_ext, self.h1_ext = round_coords((self.w1_ext, self.h1_ext))
         self.w2_ext, self.h2_ext = round_coords((self.w2_ext, self.h2_ext))
 
+        # Counters and row bit masks, kept up to date by the rows
+        self.n_reserved         = 0                         # reserved places
+        self.n_stored           = 0                         # roll containers in store
+        self.available_rows     = (1<<M.N_BUFFER_ROW) - 1  # rows with places that are not reserved
+        self.not_scheduled_rows = 0                         # rows with roll containers that are not scheduled
+
         self.w_dict = dict([(col, round_coord(self.w1 + (col+0.5) * W_BUFFER_COMP)) for col in range(M.N_BUFFER_COL)])
         self.h_dict = dict([(row, round_coord(self.h1 + (row+0.5) * H_BUFFER_COMP)) for row in range(M.N_BUFFER_ROW)])
         self.store  = [BufferStoreRow(self.w_dict, self.h_dict[row], row, self) for row in range(M.N_BUFFER_ROW)]
@@ -103,30 +231,29 @@ class BufferStore:
         return text
 
     def is_store_unused(self):
-        for row_store in self.store:
-            if row_store.n_store_reserved>0: return False
-        return True
+        return self.n_reserved==0
+
+    def update_manager(self):
+        # Called by the rows when their reservations change
+        if self.manager is not None:
+            self.manager.update_store(self.dock, self.buffer, self.n_reserved==0, self.available_rows!=0)
 
     def schedule_roll_container(self, row):
         self.store[row].schedule_roll_container()
 
     def get_row_not_scheduled(self):
-        for row in range(M.N_BUFFER_ROW):
-            if self.store[row].get_n_not_scheduled()>0:
-                return row
-        return -1
+        # lowest row with a roll container that is not scheduled (-1 if there is none)
+        return (self.not_scheduled_rows & -self.not_scheduled_rows).bit_length() - 1
 
     def get_first_available_store(self):
-        for row in range(M.N_BUFFER_ROW):
-            if self.store[row].is_store_available():
-                return row
-        return -1
+        # lowest row with a place that is not reserved (-1 if there is none)
+        return (self.available_rows & -self.available_rows).bit_length() - 1
 
     def reserve_store(self, row):
         self.store[row].reserve_store()
 
     def get_n_stored(self):
-        return sum(self.store[row].get_n_stored() for row in range(M.N_BUFFER_ROW))
+        return self.n_stored
 
     def store_roll_container(self, row, rol):
         if row>=M.N_BUFFER_ROW: return
@@ -159,6 +286,7 @@ class BufferStore:
         else:    return round_coords((self.w2_ext, self.h1 + 0.5 * H_BUFFER_COMP))
 
     def draw(self, floor_plan):
+        import cv2 as cv
         for i in range(M.N_BUFFER_COL):
             w1 = self.w1 + i * W_BUFFER_COMP
             w2 = self.w1 + (i + 1) * W_BUFFER_COMP
@@ -176,7 +304,9 @@ class BufferStore:
             for rol in self.store[row].store:
                 rol.draw(floor_plan)
 
-        dest, prio = BSM.loc_dp_dict[self.dock, self.buffer]
+        dp = floor_plan.context.bsm.loc_dp_dict[self.dock, self.buffer]
+        if dp is None: return
+        dest, prio = dp
         col = destination_color_dict[dest]
         lt  = 1 if prio==PRIO_LIST[0] else 2
         pt1 = floor_plan.pnt_from_coords(self.w1, self.h1)
@@ -184,6 +314,7 @@ class BufferStore:
         floor_plan.figure = cv.rectangle(floor_plan.figure, pt1, pt2, col, lt)
 
     def draw_circulation(self, floor_plan):
+        import cv2 as cv
         # horizontal, to left
         pt1 = floor_plan.pnt_from_coords(self.w1, self.h2_ext)
         pt2 = floor_plan.pnt_from_coords(self.w2, self.h2_ext)
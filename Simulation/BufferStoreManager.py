@@ -1,65 +1,132 @@
+import heapq
+import bisect
 from collections import defaultdict
 
 from ModelParameters import ModelParams as M
 
 from Position import Position
-from SimulationConfig import get_output_dock, destination_from_dock, prio_from_dock
+from SimulationConfig import get_output_dock, destination_from_dock, prio_from_dock, DESTINATIONS, MAX_PRIO
+
+class BufferOverflowError(RuntimeError):
+    # No buffer store left for the roll containers of a destination
+    pass
 
 class BufferStoreManager:
     def __init__(self):
-        self.loc_dp_dict = dict([((d,b), (destination_from_dock(d), prio_from_dock(d))) for d in range(M.N_DOCK) for b in range(M.N_BUFFER_STORE)])
-        self.buffer_dict  = defaultdict(list)
-        self.__update_buffer_dict()
+        self.reset()
+
+    def reset(self):
+        # (Re)initialize store assignments from the current model parameters. The stores of docks beyond the output
+        # docks of all destinations (large layouts) are not assigned (None) until they are taken.
+        n_output         = len(DESTINATIONS)*MAX_PRIO
+        self.loc_dp_dict = dict([((d,b), (destination_from_dock(d), prio_from_dock(d)) if d<n_output else None) for d in range(M.N_DOCK) for b in range(M.N_BUFFER_STORE)])
 
-    def __update_buffer_dict(self):
-        self.buffer_dict = defaultdict(list)
+        # dock_rank[d1][d2]: position of dock d2 when the docks are ordered by their distance to dock d1 (left first)
+        self.dock_rank = []
         for dock in range(M.N_DOCK):
-            for buffer in range(M.N_BUFFER_STORE):
-                self.buffer_dict[self.loc_dp_dict[dock,buffer]].append((dock,buffer))
+            docks = [dock]+[dock + pm * (d + 1) for d in range(M.N_DOCK) for pm in [-1, 1] if 0<=dock + pm * (d + 1)<M.N_DOCK]
+            rank  = [0]*M.N_DOCK
+            for r, d in enumerate(docks):
+                rank[d] = r
+            self.dock_rank.append(rank)
+
+        # search_order[dock]: stores in the order in which an unused one is taken for output dock: first the stores
+        # of the dock itself, from the lowest one, then those of the other docks by distance, from the highest one
+        self.search_order = []
+        for dock in range(M.N_DOCK):
+            docks = sorted(range(M.N_DOCK), key=lambda d: self.dock_rank[dock][d])
+            self.search_order.append([(dock, b) for b in range(M.N_BUFFER_STORE)] +
+                                     [(d, b) for d in docks[1:] for b in range(M.N_BUFFER_STORE-1, -1, -1)])
 
-    def get_sorted_robots(self, robots, dock):
-        docks = [dock]+[dock + pm * (d + 1) for d in range(M.N_DOCK) for pm in [-1, 1] if 0<=dock + pm * (d + 1)<M.N_DOCK]
-        return sorted(robots, key=lambda x: docks.index(x.default_pos.dock) + len(x.task_list))
+        # search_bit[dock][d*N_BUFFER_STORE+b]: bit of store (d, b) in unused_masks[dock], by its place in search_order[dock]
+        self.search_bit = []
+        for dock in range(M.N_DOCK):
+            bits = [0]*(M.N_DOCK*M.N_BUFFER_STORE)
+            for n, (d, b) in enumerate(self.search_order[dock]):
+                bits[d*M.N_BUFFER_STORE+b] = 1<<n
+            self.search_bit.append(bits)
+
+        # Stores assigned to each (destination, prio), in (dock, buffer) order, and their get_buffer_list() order
+        self.buffer_dict      = defaultdict(list)
+        self.buffer_list_dict = dict()
+        for (dock, buffer) in sorted(self.loc_dp_dict):
+            self.buffer_dict[self.loc_dp_dict[dock, buffer]].append((dock, buffer))
+
+        # Bit masks of the stores, with bit d*N_BUFFER_STORE+b for store (d, b), kept up to date by update_store():
+        # available_mask           : stores with places that are not reserved
+        # unused_mask              : stores without reservations
+        # available_dict[dest,prio]: available stores assigned to (dest, prio)
+        # unused_masks[dock]       : unused stores, with the bits of search_bit[dock] (first in search order: lowest bit)
+        n_store             = M.N_DOCK*M.N_BUFFER_STORE
+        self.available_mask = (1<<n_store) - 1
+        self.unused_mask    = (1<<n_store) - 1
+        self.available_dict = defaultdict(int)
+        for (dp, stores) in self.buffer_dict.items():
+            for (dock, buffer) in stores:
+                self.available_dict[dp] |= 1<<(dock*M.N_BUFFER_STORE+buffer)
+        self.unused_masks   = [(1<<n_store) - 1 for _ in range(M.N_DOCK)]
+
+    def __assign_store(self, dock, buffer, dest, prio):
+        # Move a store to another (destination, prio), keeping the store lists in order
+        dp_old = self.loc_dp_dict[dock, buffer]
+        self.buffer_dict[dp_old].remove((dock, buffer))
+        bisect.insort(self.buffer_dict[dest, prio], (dock, buffer))
+        self.loc_dp_dict[dock, buffer] = (dest, prio)
+
+        bit = 1<<(dock*M.N_BUFFER_STORE+buffer)
+        if self.available_mask & bit:
+            self.available_dict[dp_old]     &= ~bit
+            self.available_dict[dest, prio] |=  bit
+
+        self.buffer_list_dict.pop(dp_old      , None)
+        self.buffer_list_dict.pop((dest, prio), None)
+
+    def update_store(self, dock, buffer, unused, available):
+        # Keep the store masks up to date with the reservations of store (dock, buffer), see BufferStore
+        n   = dock*M.N_BUFFER_STORE+buffer
+        bit = 1<<n
+        if available!=bool(self.available_mask & bit):
+            dp = self.loc_dp_dict[dock, buffer]
+            self.available_mask     ^= bit
+            self.available_dict[dp] ^= bit
+        if unused!=bool(self.unused_mask & bit):
+            self.unused_mask ^= bit
+            for d in range(M.N_DOCK):
+                self.unused_masks[d] ^= self.search_bit[d][n]
+
+    def get_sorted_robots(self, robots, dock, k=None):
+        """
+            return robots ordered by the distance of their parking dock to dock plus their number of tasks, or only
+            the k first of them (same order, ties in the order of robots)
+        """
+        rank = self.dock_rank[dock]
+        key  = lambda x: rank[x.default_pos.dock] + len(x.task_list)
+        if k is None: return sorted(robots, key=key)
+        else:         return heapq.nsmallest(k, robots, key=key)
 
     def get_buffer_list(self, dest, prio):
-        dock_dest = get_output_dock(dest, prio)
-        prio_dict = dict()
-        docks = [dock_dest]+[dock_dest + pm * (d + 1) for d in range(M.N_DOCK) for pm in [-1, 1] if 0<=dock_dest + pm * (d + 1)<M.N_DOCK]
-        p = M.N_BUFFER_STORE*M.N_DOCK
-        for d, dock in enumerate(docks):
-            if d==0:
-                for b in range(M.N_BUFFER_STORE):
-                    prio_dict[(dock,b)] = p
-                    p -=1
-            else:
-                for b in range(M.N_BUFFER_STORE-1, -1, -1):
-                    prio_dict[(dock,b)] = p
-                    p -=1
-
-        return sorted(self.buffer_dict[dest, prio], key=lambda x: prio_dict[x])
+        # Buffer stores of dest and prio, the one furthest from the output dock first. At the output dock itself the
+        # highest store comes first, at the other docks the lowest one. The tuple is kept until a store is reassigned.
+        if (dest, prio) not in self.buffer_list_dict:
+            dock_dest = get_output_dock(dest, prio)
+            rank      = self.dock_rank[dock_dest]
+            self.buffer_list_dict[dest, prio] = tuple(sorted(self.buffer_dict[dest, prio], key=lambda x: (-rank[x[0]], -x[1] if x[0]==dock_dest else x[1])))
+        return self.buffer_list_dict[dest, prio]
 
     def find_available_buffer_store(self, floor_plan, dest, prio):
-        dock_store_list = self.buffer_dict[dest, prio]
-        for (dock, buffer) in dock_store_list:
-            if floor_plan.buffer_stores[dock, buffer].get_first_available_store()>=0:
-                return floor_plan.buffer_stores[dock, buffer]
+        # First store of dest and prio, in (dock, buffer) order, with a place that is not reserved
+        mask = self.available_dict[dest, prio]
+        if mask:
+            dock, buffer = divmod((mask & -mask).bit_length() - 1, M.N_BUFFER_STORE)
+            return floor_plan.buffer_stores[dock, buffer]
 
-        # First search for a free store in the default output dock
-        dock = get_output_dock(dest, prio)
-        for buffer in range(M.N_BUFFER_STORE):
-            if floor_plan.buffer_stores[dock, buffer].is_store_unused():
-                self.loc_dp_dict[dock, buffer] = (dest, prio)
-                self.__update_buffer_dict()
-                return floor_plan.buffer_stores[dock, buffer]
-
-        # Search globally
-        docks = [dock + pm * (d + 1) for d in range(M.N_DOCK) for pm in [-1, 1] if 0<=dock + pm * (d + 1)<M.N_DOCK]
-        for dock in docks:
-            for buffer in range(M.N_BUFFER_STORE-1, -1, -1):
-                if floor_plan.buffer_stores[dock, buffer].is_store_unused():
-                    self.loc_dp_dict[dock, buffer] = (dest, prio)
-                    self.__update_buffer_dict()
-                    return floor_plan.buffer_stores[dock, buffer]
+        # Take the nearest unused store of the default output dock or, if there is none, of the other docks
+        dock_dest = get_output_dock(dest, prio)
+        mask      = self.unused_masks[dock_dest]
+        if mask:
+            dock, buffer = self.search_order[dock_dest][(mask & -mask).bit_length() - 1]
+            self.__assign_store(dock, buffer, dest, prio)
+            return floor_plan.buffer_stores[dock, buffer]
 
         print("ERROR: BufferStoreManager.find_available_buffer_store(). Cannot find unused buffer. ")
 
@@ -73,6 +140,7 @@ class BufferStoreManager:
             buffer_store = self.find_available_buffer_store(floor_plan, dest, prio)
             if buffer_store is None:
                 print("ERROR: BufferStoreManager.choose_store(). buffer overflow. prio = ", prio, "dest = ", dest)
+                raise BufferOverflowError(f"buffer overflow, dest = {dest}, prio = {prio}")
 
             store     = buffer_store.buffer
             dock      = buffer_store.dock
@@ -0,0 +1,163 @@
+import io
+import os
+import json
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from FloorPlan import FloorPlan
+from Parking import Parking
+from Simulation import AbortCriteria
+from ParameterSweep import get_grid_points, get_point_key, set_point_params, run_point, get_result_row
+
+from ModelParameters import ModelParams as M
+
+
+def is_feasible(row, max_nrc_not_unloaded=0):
+    # All inbound trucks leave (nearly) empty. The run is stopped as soon as this fails, see get_feasibility_criteria()
+    return row["nrc_not_unloaded"]<=max_nrc_not_unloaded and row["abort_reason"]==""
+
+def get_feasibility_criteria(max_nrc_not_unloaded=0):
+    return AbortCriteria(max_nrc_not_unloaded=max_nrc_not_unloaded, buffer_overflow=True)
+
+def get_max_n_robot(base_params, point):
+    # number of parking places of the floor plan of point: robots beyond it have no place
+    M().set_params(base_params)
+    set_point_params(point)
+    n_robot = M.N_DOCK * Parking(0).get_n_parking()
+    M().set_params(base_params)
+    return n_robot
+
+def warm_path_cache(base_params, point):
+    """
+        Create the grid graph and path tables of the floor plan of point in the cache, once, before the workers
+        that simulate it with different fleet sizes need them.
+    """
+    M().set_params(base_params)
+    set_point_params(point)
+    if M.PATH_CACHE:
+        with contextlib.redirect_stdout(io.StringIO()):
+            FloorPlan(headless=True)
+    M().set_params(base_params)
+
+def get_candidates(lo, hi, n_candidate, hint=None):
+    """
+        return at most n_candidate fleet sizes in (lo, hi) that split it in equal parts, with hint-1 and hint first
+        (a warm start from the result of a similar buffer configuration).
+    """
+    candidates = []
+    if hint is not None:
+        candidates += [n for n in (hint, hint-1) if lo<n<hi]
+    n_split     = n_candidate-len(candidates)
+    candidates += [int(round(n)) for n in np.linspace(lo, hi, n_split+2)[1:-1]] if n_split>0 else []
+    return sorted(set(n for n in candidates if lo<n<hi))[:n_candidate]
+
+def search_n_robot(executor, n_worker, base_params, point, n_robot_min, n_robot_max, simulate, x_dock_name,
+                   max_nrc_not_unloaded=0, hint=None, rows=None):
+    """
+        return the minimum feasible N_ROBOT in [n_robot_min, n_robot_max] for the buffer configuration of point, or
+        None if n_robot_max is not feasible (see is_feasible()) or a run failed (column error, see
+        ParameterSweep.get_result_row()). Feasibility is assumed to increase with the fleet size.
+        Each round simulates up to n_worker fleet sizes concurrently and keeps the part between the largest infeasible
+        and the smallest feasible one (bisection for a single worker). All evaluated rows are appended to rows.
+    """
+    rows       = [] if rows is None else rows
+    criteria   = get_feasibility_criteria(max_nrc_not_unloaded)
+    lo, hi     = n_robot_min-1, n_robot_max  # lo: infeasible, hi: feasible (when checked)
+    hi_checked = False
+    while hi-lo>1 or not hi_checked:
+        candidates = [] if hi_checked else [hi]
+        candidates = sorted(candidates + get_candidates(lo, hi, n_worker-len(candidates), hint))
+        hint       = None
+
+        futures = [executor.submit(run_point, base_params, dict(point, set_n_robot=n), simulate, x_dock_name,
+                                   criteria) for n in candidates]
+        results = []
+        for n, future in zip(candidates, futures):
+            row = get_result_row(future, dict(point, set_n_robot=n))
+            row.update(n_robot=n, feasible=None if row["error"] else is_feasible(row, max_nrc_not_unloaded))
+            rows.append(row)
+            results.append((n, row["feasible"]))
+
+        # A failed run is neither feasible nor infeasible: the search cannot go on
+        if any(feasible is None for (n, feasible) in results):
+            print(f"search: {get_point_key(point):s} stopped, run failed")
+            return None
+        if not hi_checked and not dict(results)[hi]:
+            return None
+        hi_checked = True
+        hi = min([n for (n, feasible) in results if     feasible] + [hi])
+        lo = max([n for (n, feasible) in results if not feasible and n<hi] + [lo])
+        print(f"search: {get_point_key(point):s} N_ROBOT in ({lo:d}, {hi:d}]")
+    return hi
+
+def search_capacity(buffer_grid, n_robot_min, n_robot_max, simulate=True, x_dock_name="C_TL", max_workers=None,
+                    max_nrc_not_unloaded=0):
+    """
+        return the minimum feasible N_ROBOT for every buffer configuration of buffer_grid (a grid as in
+        ParameterSweep.get_grid_points(), e.g. {"set_n_buffer_store": [2, 3], "set_max_buffer_lane_store": [12, 18]},
+        or {} for the current configuration), and the table of all evaluated runs, as DataFrames.
+        The result of each configuration is the warm start of the next one. n_robot_max may not exceed the parking
+        places of any configuration.
+    """
+    points      = get_grid_points(buffer_grid)
+    base_params = M().get_params()
+    for point in points:
+        n_park = get_max_n_robot(base_params, point)
+        if n_robot_max>n_park:
+            raise ValueError(f"search_capacity(). n_robot_max = {n_robot_max:d} exceeds the {n_park:d} parking places of {get_point_key(point):s}")
+
+    rows        = []
+    summary     = []
+    hint        = None
+    n_worker    = max_workers or os.cpu_count()
+    t0          = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for point in points:
+            warm_path_cache(base_params, point)
+
+            n_run   = len(rows)
+            n_robot = search_n_robot(executor, n_worker, base_params, point, n_robot_min, n_robot_max, simulate,
+                                     x_dock_name, max_nrc_not_unloaded, hint, rows)
+            hint    = n_robot if n_robot is not None else hint
+
+            errors = [row["error"] for row in rows[n_run:] if row["error"]]
+            summary.append(dict(((name, json.dumps(value)) for (name, value) in point.items()), min_n_robot=n_robot,
+                                n_run=len(rows)-n_run, error=errors[0] if errors else ""))
+            print(f"search: {get_point_key(point):s} minimum N_ROBOT = {n_robot} ({len(rows)-n_run:d} runs, "
+                  f"{time.perf_counter()-t0:.0f} s)")
+
+    return pd.DataFrame(summary), pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the minimum fleet size at which all inbound trucks are unloaded")
+    parser.add_argument("--buffer-grid", default="{}", help='buffer configurations as json, e.g. \'{"set_n_buffer_store": [2, 3], "set_max_buffer_lane_store": [12, 18]}\'')
+    parser.add_argument("--n-robot-min", type=int, default=4)
+    parser.add_argument("--n-robot-max", type=int, default=64)
+    parser.add_argument("--max-not-unloaded", type=int, default=0, help="roll containers allowed on departed inbound trucks")
+    parser.add_argument("--out", default=None, help="csv file with all evaluated runs")
+    parser.add_argument("--simulate", action="store_true", help="use the simulated truck plan instead of the transport scheme")
+    parser.add_argument("--x-dock", default="C_TL", help="cross dock name in the transport scheme")
+    parser.add_argument("--data-dir", default=M.DATA_DIR, help="directory with input file and logging sub directory")
+    parser.add_argument("--data-file", default=M.DATA_FILE, help="transport scheme (excel)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of cores)")
+    args = parser.parse_args()
+
+    params = M()
+    params.set_data_dir(args.data_dir)
+    params.set_data_input_file(args.data_file)
+    params.set_robot_logging(False)
+
+    summary, runs = search_capacity(json.loads(args.buffer_grid), args.n_robot_min, args.n_robot_max, args.simulate,
+                                    args.x_dock, args.workers, args.max_not_unloaded)
+    if args.out: runs.to_csv(args.out, index=False)
+    print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import time
+
+from Simulation import Simulation
+
+from ModelParameters import ModelParams as M
+
+# Time stepping modes of Simulation, the first one is the reference
+MODES = {"tick":         dict(),
+         "fast-forward": dict(fast_forward=True),
+         "event-driven": dict(event_driven=True)}
+
+LOG_NAMES = ["Robots", "Stores", "Trucks"]
+
+
+def read_log(sim, name):
+    try:
+        with open(sim.context.get_log_filename(name)) as fp:
+            return fp.read()
+    except FileNotFoundError:
+        return ""
+
+
+def run_mode(args, kwargs):
+    """
+        return KPIs, log file contents, number of regular time steps and wall clock time of one run
+    """
+    sim    = Simulation(args.simulate, args.x_dock, seed=args.seed, **kwargs)
+    n_step = 0
+    t0     = time.perf_counter()
+    while not sim.is_finished():
+        sim.step()
+        n_step += 1
+    dt = time.perf_counter() - t0
+
+    results = sim.floor_plan.get_results()
+    logs    = {name: read_log(sim, name) for name in LOG_NAMES}
+    return results, logs, n_step, dt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the KPIs and logs of tick, fast-forward and event-driven runs")
+    parser.add_argument("--simulate", action="store_true", help="use the simulated truck plan instead of the transport scheme")
+    parser.add_argument("--x-dock", default="C_TL", help="cross dock name in the transport scheme")
+    parser.add_argument("--data-dir", default=M.DATA_DIR, help="directory with input file and logging sub directory")
+    parser.add_argument("--data-file", default=M.DATA_FILE, help="transport scheme (excel)")
+    parser.add_argument("--n-robot", type=int, default=M.N_ROBOT)
+    parser.add_argument("--dispatcher", default=M.DISPATCHER, choices=["greedy", "assignment"], help="robot selection for new jobs")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the simulated truck plan")
+    args = parser.parse_args()
+
+    params = M()
+    params.set_data_dir(args.data_dir)
+    params.set_data_input_file(args.data_file)
+    params.set_n_robot(args.n_robot)
+    params.set_robot_logging(True)
+    params.set_dispatcher(args.dispatcher)
+
+    runs = {mode: run_mode(args, kwargs) for (mode, kwargs) in MODES.items()}
+
+    ref_results, ref_logs, ref_n_step, ref_dt = runs["tick"]
+    n_diff = 0
+    for mode, (results, logs, n_step, dt) in runs.items():
+        diff = [] if results==ref_results else ["KPIs"]
+        diff += [name+" log" for name in LOG_NAMES if logs[name]!=ref_logs[name]]
+        n_diff += len(diff)
+
+        status = "identical" if len(diff)==0 else "different " + ", ".join(diff)
+        print(f"{mode:12s}: {n_step:7d} steps, {dt:7.2f} s ({ref_dt/dt:4.2f}x), {status:s}")
+
+    for name, value in ref_results._asdict().items():
+        print(f"{name:20s} = {value}")
+
+    if n_diff>0:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
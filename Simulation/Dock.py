@@ -1,4 +1,4 @@
-import cv2 as cv
+import math
 
 from XdockParams import W_DOCK, H_DOCK_LEGENDS,  \
                         WHITE, TIME_STEP_S,\
@@ -37,6 +37,7 @@ class Dock:
         self.truck_list = sorted([truck for truck in truck_list if truck.dock==self.dock], key=lambda t: t.arrival)
 
     def draw(self, floor_plan):
+        import cv2 as cv
         if self.truck is None:
             pt1 = floor_plan.pnt_from_coords(self.w1, self.h2-0.15)
             pt2 = floor_plan.pnt_from_coords(self.w2, self.h1)
@@ -104,6 +105,35 @@ class Dock:
             self.roll_container = None
             self.rc_dead_time   = M.TIME_LOAD_BUFFER_LANE
 
+    def skip_steps(self, n_step):
+        # Equivalent to n_step calls of time_step(), provided that get_n_idle_steps()>=n_step
+        if self.truck:
+            self.truck.skip_steps(2*n_step) # time_step() advances a docked truck twice
+
+        if self.roll_container:
+            self.rc_dead_time -= n_step*TIME_STEP_S
+
+    def get_n_idle_steps(self, floor_plan):
+        """
+            return number of time steps before a truck arrives or the dock or its truck can change state
+        """
+        n_step = math.inf
+        if len(self.truck_list)>0:
+            n_step = int((self.truck_list[0].arrival-floor_plan.time_sec)/TIME_STEP_S)
+
+        if self.roll_container and self.rc_dead_time>0.:
+            n_step = min(n_step, int(self.rc_dead_time/TIME_STEP_S))
+
+        if self.truck is None:
+            return max(0, n_step)
+
+        if self.truck.inbound and self.roll_container is None and self.truck.can_be_unloaded():
+            return 0
+        if not self.truck.inbound and not self.roll_container is None and self.rc_dead_time<=0.:
+            return 0
+
+        return max(0, min(n_step, self.truck.get_n_idle_steps()//2))
+
     def roll_container_available(self):
         if not self.truck or not self.truck.inbound: return False
         return not self.roll_container is None and self.rc_dead_time<=0.
@@ -1,35 +1,35 @@
+import os
 import math
+from collections import namedtuple
 
-import cv2 as cv
 import numpy as np
 
-import os
-import sys
-import inspect
-
 from XdockParams import W_DOCK, N_LANE, H_DOCK_LEGENDS, \
                         TIME_STEP_S, \
                         BLACK, \
-                        get_distance_city_block, get_distance
+                        get_distance_city_block, get_distance, get_path_len
 
 from  ModelParameters import ModelParams as M
-from  ModelParameters import get_model_params, get_log_filename
+from  ModelParameters import get_model_params, get_cache_filename
 
-from Robot import Robot
+from Robot import Robot, RobotFleet
 from Dock import Dock
 from Parking import Parking
 from Position import Position
-from BufferStore import BufferStore
-from BufferLane import BufferLane
+from BufferStore import BufferStore, BufferStoreArray
+from BufferLane import BufferLane, BufferLaneArray
+from PathMatrix import PathMatrix, save_path_cache, load_path_cache, create_path_memmap, load_path_memmap
+from GridGraph import DiGraph
+from HierarchicalPaths import HierarchicalPaths
+from SimulationContext import SimulationContext
 
 
-currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
-parentdir = currentdir[0:os.path.dirname(currentdir).rfind("\\")]
-sys.path.insert(0, parentdir+"\\dks-ketenrekenmodel\\src\\krm\\core")
-import GraphTools as GT
+SimulationResults = namedtuple("simulation_results", "nrc_in_buffer_store nrc_in_buffer_lane nrc_not_unloaded trucks_not_unloaded")
 
 class FloorPlan:
-    def __init__(self):
+    def __init__(self, headless=False, context=None):
+        self.context      = SimulationContext() if context is None else context
+        self.context.activate()
         border_w          = 70
         border_h          = 100
         self.fig_width    = 1000
@@ -38,27 +38,25 @@ class FloorPlan:
             self.fig_height = 800
             self.fig_width  = border_h + int((self.fig_height - border_h) * M.W_FLOOR/M.H_FLOOR)
 
-        self.figure       = np.full((self.fig_height, self.fig_width, 3), 255, np.uint8)
+        self.headless     = headless
+        self.figure       = None if headless else np.full((self.fig_height, self.fig_width, 3), 255, np.uint8)
 
         self.top_left     = (20, 50)
         self.bottom_right = (self.fig_width-(border_w-self.top_left[0]), self.fig_height-(border_h-self.top_left[1]))
+        self.lane_array    = BufferLaneArray()
+        self.store_array   = BufferStoreArray(self.context)
         self.buffer_lanes  = dict()
         self.buffer_stores = dict()
         self.parkings      = dict()
         self.docks         = dict()
-        pos_list           = []
         for dock in range(M.N_DOCK):
             self.docks[dock]    = Dock(dock)
             self.parkings[dock] = Parking(dock)
-            pos_list           += self.parkings[dock].get_park_positions()
             for lane in range(N_LANE):
-                self.buffer_lanes[dock, lane]  = BufferLane(dock, lane)
-                pos_list                        += [self.buffer_lanes[dock, lane].get_grid_coords()]
+                self.buffer_lanes[dock, lane]  = BufferLane(dock, lane, self.lane_array)
             for store in range(M.N_BUFFER_STORE):
-                self.buffer_stores[dock, store] = BufferStore(dock, store)
-                pos_list                        += self.buffer_stores[dock, store].get_store_positions()
-        self.grid_graph = self.__create_grid()
-        self.path_table = GT.PathTable(self.grid_graph, pos_list, get_distance_city_block)
+                self.buffer_stores[dock, store] = BufferStore(dock, store, self.store_array, self.context.bsm)
+        self.grid_graph, self.path_matrix = self.__create_paths()
 
         self.robots = []
         for r in range(M.N_ROBOT):
@@ -66,22 +64,32 @@ class FloorPlan:
             if parking_pos is None:
                 break
             color = None if r!=10 else (0, 0, 255)
-            self.robots.append(Robot(parking_pos.w, parking_pos.h, parking_pos, color))
+            self.robots.append(Robot(parking_pos.w, parking_pos.h, parking_pos, self.context, color))
+        self.fleet = RobotFleet(self.robots, self.context)
 
         # Legends parameters
         self.time_sec     = 0.
         self.n_trucks_in  = 0
         self.n_trucks_out = 0
 
+    def __getstate__(self):
+        # For snapshots (see Snapshot.py): without figure and path tables, which only depend on the model parameters
+        state = self.__dict__.copy()
+        state.update(figure=None, grid_graph=None, path_matrix=None)
+        return state
+
+    def __setstate__(self, state):
+        # The model parameters of the snapshot must be current
+        self.__dict__.update(state)
+        if not self.headless:
+            self.figure = np.full((self.fig_height, self.fig_width, 3), 255, np.uint8)
+        self.grid_graph, self.path_matrix = self.__create_paths()
+
     def time_step(self):
+        self.lane_array.time_step()
         for dock in range(M.N_DOCK):
             self.docks[dock].time_step(self)
 
-            # time step each lane
-            for lane in range(N_LANE):
-                buffer_lane = self.buffer_lanes[dock, lane]
-                buffer_lane.time_step()
-
             # Test if there is an unloaded roll container available at the dock and determine the least loaded lane (if any stores less than MAX_LANE_STORE roll containers)
             if self.docks[dock].roll_container_available():
                 lane = self.get_best_available_lane(dock, output=False)
@@ -99,10 +107,57 @@ class FloorPlan:
                     if buffer_lane.can_be_unloaded():
                         self.docks[dock].put_roll_container(buffer_lane.pickup_roll_container())
 
-        for rob in self.robots:
-            rob.time_step(self)
+        self.fleet.time_step(self)
 
         self.time_sec += TIME_STEP_S
+        if M.ROBOT_LOGGING: self.store_array.log(self.time_sec)
+
+    def get_n_idle_steps(self):
+        """
+            return number of time steps that can be skipped with skip_steps(), because no discrete event
+            (truck arrival or departure, roll container transfer, task completion) will happen in them
+        """
+        # Robots have the most events: test them first. The robot fleet counts whole time steps, which it also skips
+        # in time_step(), so it needs no margin for round off errors.
+        n_robot = self.fleet.get_n_idle_steps(self)
+        if n_robot<=0: return 0
+
+        n_step = math.inf
+        for dock in range(M.N_DOCK):
+            if self.__can_transfer_roll_container(dock): return 0
+
+            n_step = min(n_step, self.docks[dock].get_n_idle_steps(self))
+            if n_step<=0: return 0
+
+        n_step = min(n_step, self.lane_array.get_n_idle_steps())
+
+        # keep one step margin for round off errors in the event times of docks, trucks and lanes
+        return max(0, min(n_step-1, n_robot))
+
+    def skip_steps(self, n_step):
+        # Equivalent to n_step calls of time_step(), provided that get_n_idle_steps()>=n_step
+        self.lane_array.skip_steps(n_step)
+        for dock in range(M.N_DOCK):
+            self.docks[dock].skip_steps(n_step)
+
+        self.fleet.skip_steps(self, n_step)
+
+        self.time_sec += n_step*TIME_STEP_S
+        if M.ROBOT_LOGGING: self.store_array.log(self.time_sec)
+
+    def __can_transfer_roll_container(self, dock):
+        # Same tests as in time_step(), for roll containers from dock to lane and from lane to dock
+        if self.docks[dock].roll_container_available():
+            lane = self.get_best_available_lane(dock, output=False)
+            if lane>=0 and self.buffer_lanes[dock, lane].can_be_loaded():
+                return True
+
+        if self.docks[dock].can_roll_container_be_stored():
+            lane = self.get_best_available_lane(dock, output=True, loading=False)
+            if lane>=0 and self.buffer_lanes[dock, lane].can_be_unloaded():
+                return True
+
+        return False
 
     def set_truck_list(self, truck_list):
         self.n_trucks_in  = len([t for t in truck_list if t.inbound])
@@ -114,6 +169,7 @@ class FloorPlan:
     def get_next_arrival(self):
         t_next = math.inf
         for dock in range(M.N_DOCK):
+            if len(self.docks[dock].truck_list)==0: continue
             t_arrive = self.docks[dock].truck_list[0].arrival
             t_next = min(t_next, t_arrive)
 
@@ -124,48 +180,43 @@ class FloorPlan:
             if not rob.is_idle(): return False
         return True
 
+    def is_at_rest(self):
+        # No robot task, no truck at any dock and no moving roll containers on the lanes.
+        # A roll container left at a dock by a departed truck stays there until the next truck arrives.
+        if not self.are_all_robots_idle(): return False
+        for dock in range(M.N_DOCK):
+            if self.docks[dock].truck: return False
+        return self.lane_array.is_settled()
+
+    def get_n_steps_to_next_arrival(self):
+        """
+            return number of time steps that can be skipped with skip_steps() until the next truck arrival,
+            or 0 if the floor plan is not at rest
+        """
+        if not self.is_at_rest(): return 0
+
+        t_next = self.get_next_arrival()
+        if t_next==math.inf: return math.inf
+        return max(0, int((t_next-self.time_sec)/TIME_STEP_S)-1)
+
     def get_nrc_incoming(self, dock):
-        nrc = 0
-        for lane in range(N_LANE):
-            buffer_lane = self.buffer_lanes[dock, lane]
-            if buffer_lane.lane_up:
-                nrc += buffer_lane.get_n_stored()
-        return nrc
+        return self.lane_array.get_n_incoming(dock)
 
     def get_incoming_roll_containers(self, dock):
         roll_containers = []
         for lane in range(N_LANE):
             buffer_lane = self.buffer_lanes[dock, lane]
             if buffer_lane.lane_up:
-                roll_containers += buffer_lane.get_expected_roll_containers()
+                roll_containers += buffer_lane.get_expected_roll_containers(scheduled=False)
 
-        roll_containers = [rol for rol in roll_containers if not rol.roll_container.scheduled]
         return sorted(roll_containers, key=lambda x: x[0])
 
     def get_best_available_lane(self, dock, output=True, loading=True):
-        if loading:
-            n_min    =  M.MAX_LANE_STORE+1
-            lane_min = -1
-            for lane in range(N_LANE):
-                buffer_lane = self.buffer_lanes[dock, lane]
-                if (buffer_lane.lane_up and output) or (not buffer_lane.lane_up and not output): continue
-                if buffer_lane.n_store_reserved>=M.MAX_LANE_STORE: continue
-                if buffer_lane.n_store_reserved<n_min:
-                    lane_min = lane
-                    n_min    = buffer_lane.n_store_reserved
-            return lane_min
-        else:
-            n_max    =  0
-            lane_max = -1
-            for lane in range(N_LANE):
-                buffer_lane = self.buffer_lanes[dock, lane]
-                if (buffer_lane.lane_up and output) or (not buffer_lane.lane_up and not output): continue
-                if buffer_lane.get_n_stored()>n_max:
-                    lane_max = lane
-                    n_max    = buffer_lane.get_n_stored()
-            return lane_max
+        return self.lane_array.get_best_lane(dock, output, loading)
 
     def draw(self, draw_grid=False, draw_circulation=False):
+        import cv2 as cv
+        self.context.activate()
         self.figure = np.full((self.fig_height, self.fig_width, 3), 255, np.uint8)
         self.figure = cv.rectangle(self.figure, self.top_left, self.bottom_right, BLACK, 2)
 
@@ -187,6 +238,7 @@ class FloorPlan:
                 self.buffer_lanes[dock, lane].draw(self)
 
         for rob in self.robots:
+            rob.update_position(self)
             rob.draw(self)
 
     def pnt_from_coords(self, w, h):
@@ -195,8 +247,59 @@ class FloorPlan:
         y = int(self.top_left[1] + (h / M.H_FLOOR) * (self.bottom_right[1] - self.top_left[1]))
         return x, y
 
+    def __create_paths(self):
+        # Grid graph and path tables, from the cache if this layout was used before
+        if M.PATH_HIERARCHICAL:
+            grid_graph = self.__create_grid()
+            try:
+                return grid_graph, HierarchicalPaths(grid_graph, M.N_DOCK, W_DOCK)
+            except ValueError as e:
+                print("WARNING: FloorPlan.__create_paths(). No hierarchical path tables: ", e)
+                return grid_graph, PathMatrix(grid_graph)
+
+        use_cache  = M.PATH_CACHE and os.path.isdir(M.DATA_DIR)
+        if use_cache and M.PATH_MEMMAP:
+            return self.__create_paths_memmap()
+
+        cache_file = get_cache_filename("paths")
+        if use_cache and os.path.isfile(cache_file):
+            try:
+                return load_path_cache(cache_file)
+            except (OSError, ValueError, KeyError) as e:
+                print("WARNING: FloorPlan.__create_paths(). Cannot read ", cache_file, e)
+
+        grid_graph  = self.__create_grid()
+        path_matrix = PathMatrix(grid_graph)
+        if use_cache:
+            try:
+                os.makedirs(M.DATA_DIR + M.CACHE_SUB_DIR, exist_ok=True)
+                save_path_cache(cache_file, grid_graph, path_matrix)
+            except OSError as e:
+                print("WARNING: FloorPlan.__create_paths(). Cannot write ", cache_file, e)
+
+        return grid_graph, path_matrix
+
+    def __create_paths_memmap(self):
+        # Path tables as read only memory maps, shared with other processes through the OS page cache
+        graph_file    = get_cache_filename("graph")
+        dist_file     = get_cache_filename("dist"    , ext=".npy")
+        next_hop_file = get_cache_filename("next_hop", ext=".npy")
+        try:
+            if not all(os.path.isfile(f) for f in (graph_file, dist_file, next_hop_file)):
+                os.makedirs(M.DATA_DIR + M.CACHE_SUB_DIR, exist_ok=True)
+                grid_graph = self.__create_grid()
+                create_path_memmap(dist_file, next_hop_file, grid_graph)
+                save_path_cache(graph_file, grid_graph)
+
+            return load_path_cache(graph_file, *load_path_memmap(dist_file, next_hop_file))
+
+        except (OSError, ValueError, KeyError) as e:
+            print("WARNING: FloorPlan.__create_paths_memmap(). Path tables in memory, because of ", e)
+            grid_graph = self.__create_grid()
+            return grid_graph, PathMatrix(grid_graph)
+
     def __create_grid(self):
-        digraph = GT.DiGraph()
+        digraph = DiGraph()
 
         for dock in range(M.N_DOCK):
             park      = self.parkings[dock]
@@ -299,6 +402,8 @@ class FloorPlan:
         return digraph
 
     def draw_grid(self):
+        import cv2 as cv
+        self.context.activate()
         color = (100, 100, 100)
         for e in self.grid_graph.get_edge_list():
             pt1 = self.pnt_from_coords(*e[0])
@@ -322,17 +427,28 @@ class FloorPlan:
             return self.buffer_stores[dock, store].get_grid_coords(row=row, col=col)
 
     def get_shortest_path(self, pos1, pos2):
-        coords1 = pos1.get_coords()
-        coords2 = pos2.get_coords()
-        return self.path_table.get_path(coords1, coords2)
+        return self.get_path(pos1.get_coords(), pos2.get_coords())
+
+    def get_path(self, coords1, coords2):
+        if self.path_matrix.has_node(coords1) and self.path_matrix.has_node(coords2):
+            return self.path_matrix.get_path(coords1, coords2)
+        return self.grid_graph.get_shortest_path(coords1, coords2)
+
+    def get_path_length(self, coords1, coords2):
+        if self.path_matrix.has_node(coords1) and self.path_matrix.has_node(coords2):
+            return self.path_matrix.get_distance(coords1, coords2)
+        return get_path_len(self.grid_graph.get_shortest_path(coords1, coords2, get_distance_city_block))
 
     def draw_path(self, path, color=(255,0,0)):
+        import cv2 as cv
+        self.context.activate()
         p1 = path[0]
         for p in path:
             self.figure = cv.line(self.figure, self.pnt_from_coords(*p1), self.pnt_from_coords(*p), color, 2)
             p1 = p
 
     def __draw_legends(self):
+        import cv2 as cv
         # Arrow to denote width of one dock
         h   = 1.01 * M.H_FLOOR
         pt1 = self.pnt_from_coords(0.      , h)
@@ -404,26 +520,37 @@ class FloorPlan:
         return [t for dock in range(M.N_DOCK) for t in self.docks[dock].incomplete_unloaded]
 
     def get_n_roll_containers_in_store(self):
-        return sum(self.buffer_stores[dock, buffer].get_n_stored() for buffer in range(M.N_BUFFER_STORE) for dock in range(M.N_DOCK))
+        return self.store_array.get_n_stored()
 
     def get_n_roll_containers_in_lanes(self):
-        return sum(self.buffer_lanes[dock, lane].get_n_stored() for lane in range(N_LANE) for dock in range(M.N_DOCK))
+        return int(self.lane_array.n_stored.sum())
+
+    def get_results(self):
+        self.context.activate()
+        t_list = self.get_incompletely_unloaded_trucks()
+        return SimulationResults(nrc_in_buffer_store = self.get_n_roll_containers_in_store(),
+                                 nrc_in_buffer_lane  = self.get_n_roll_containers_in_lanes(),
+                                 nrc_not_unloaded    = sum(len(t.truck_load) for t in t_list),
+                                 trucks_not_unloaded = [t.ID for t in t_list])
 
     def log_results(self):
+        self.context.activate()
         text = get_model_params()
         text += "\n\n\nResults:\n"
-        t_list = self.get_incompletely_unloaded_trucks()
-        text += f"NRC_in_buffer_store = {self.get_n_roll_containers_in_store():d} \n" +\
-                f"NRC_in_buffer_lane  = {self.get_n_roll_containers_in_lanes():d} \n" +\
-                f"NRC_not_unloaded    = {sum(len(t.truck_load) for t in t_list):d} \n"
+        t_list  = self.get_incompletely_unloaded_trucks()
+        results = self.get_results()
+        text += f"NRC_in_buffer_store = {results.nrc_in_buffer_store:d} \n" +\
+                f"NRC_in_buffer_lane  = {results.nrc_in_buffer_lane:d} \n" +\
+                f"NRC_not_unloaded    = {results.nrc_not_unloaded:d} \n"
 
         text += "Unloaded trucks: \n"
         if len(t_list)>0:
             text += t_list[0]._get_log_line(True)+'\n'
             for t in t_list:
                 text += t._get_log_line(False)+'\n'
-        with open(get_log_filename("Results"), "w") as fp:
+        with open(self.context.get_log_filename("Results"), "w") as fp:
             fp.write(text)
 
     def imshow(self, name):
+        import cv2 as cv
         cv.imshow(name, self.figure)
@@ -0,0 +1,209 @@
+import heapq
+import numpy as np
+
+from XdockParams import get_distance_city_block
+
+
+class DiGraph:
+    """
+        Directed graph with float tuple coordinates as vertices and city block edge lengths.
+        Vertices are mapped to integer IDs (in order of appearance) and the adjacency is compiled
+        into compressed sparse row (CSR) arrays on the first query after the graph is modified:
+        the neighbors of vertex i are indices[indptr[i]:indptr[i+1]], with edge lengths in weights.
+    """
+    def __init__(self):
+        self.v_neighbors = dict()  # vertex -> list of successors
+        self.node_list   = []
+        self.node_dict   = dict()  # vertex -> ID
+        self.indptr      = np.zeros(1, np.int32)
+        self.indices     = np.zeros(0, np.int32)
+        self.weights     = np.zeros(0, float)
+        self.n_expanded  = 0
+        self.__compiled  = False
+
+    @staticmethod
+    def from_arrays(coords, indptr, indices):
+        """
+            return graph with vertex i at coords[i] and edges from vertex i to indices[indptr[i]:indptr[i+1]]
+            (the inverse of get_arrays())
+        """
+        graph           = DiGraph()
+        graph.node_list = [tuple(c) for c in coords.tolist()]
+        graph.node_dict = dict((p, i) for i, p in enumerate(graph.node_list))
+        indptr          = indptr.tolist()
+        indices         = indices.tolist()
+        for i, p in enumerate(graph.node_list):
+            graph.v_neighbors[p] = [graph.node_list[j] for j in indices[indptr[i]:indptr[i+1]]]
+        return graph
+
+    def get_arrays(self):
+        # Vertex coordinates and CSR adjacency
+        self.compile()
+        return np.array(self.node_list, float).reshape(-1, 2), self.indptr, self.indices
+
+    def add_node(self, p):
+        if p not in self.v_neighbors:
+            self.v_neighbors[p] = []
+            self.node_dict[p]   = len(self.node_list)
+            self.node_list.append(p)
+            self.__compiled     = False
+
+    def add_edge(self, p1, p2):
+        if p1==p2: return
+        self.add_node(p1)
+        self.add_node(p2)
+
+        if p2 not in self.v_neighbors[p1]:
+            self.v_neighbors[p1].append(p2)
+            self.__compiled = False
+
+    def get_edge_list(self):
+        return [(p1, p2) for p1 in self.v_neighbors for p2 in self.v_neighbors[p1]]
+
+    def get_n_nodes(self):
+        return len(self.node_list)
+
+    def compile(self):
+        if self.__compiled: return
+
+        n_edges      = [len(self.v_neighbors[p]) for p in self.node_list]
+        self.indptr  = np.zeros(len(self.node_list)+1, np.int32)
+        self.indptr[1:] = np.cumsum(n_edges)
+        self.indices = np.array([self.node_dict[q] for p in self.node_list for q in self.v_neighbors[p]], np.int32)
+        self.weights = np.array([get_distance_city_block(p, q) for p in self.node_list for q in self.v_neighbors[p]], float)
+
+        # Python lists of the same data: much faster than numpy arrays for the element wise access in the searches
+        self.__adjacency = [list(zip(self.indices[b:e].tolist(), self.weights[b:e].tolist()))
+                            for b, e in zip(self.indptr[:-1].tolist(), self.indptr[1:].tolist())]
+        self.__coords    = [(float(p[0]), float(p[1])) for p in self.node_list]
+
+        # Begin and end coordinates of all edges, to locate points on edges
+        src = np.repeat(np.arange(len(self.node_list)), n_edges)
+        xy  = np.array(self.node_list, float).reshape(-1, 2)
+        self.__edge_coords = (xy[src,0], xy[src,1], xy[self.indices,0], xy[self.indices,1])
+        self.__compiled  = True
+
+    def find_edge(self, coords):
+        """
+            return edge (p1, p2) with coords strictly between p1 and p2, or None
+        """
+        edges = self.find_edges(coords)
+        return edges[0] if len(edges)>0 else None
+
+    def find_edges(self, coords):
+        """
+            return all edges (p1, p2) with coords strictly between p1 and p2 (both directions of a two-way edge)
+        """
+        self.compile()
+        w, h = coords
+        w1, h1, w2, h2 = self.__edge_coords
+        on_edge = ((w1==w) & (w2==w) & (np.minimum(h1, h2)<h) & (h<np.maximum(h1, h2))) | \
+                  ((h1==h) & (h2==h) & (np.minimum(w1, w2)<w) & (w<np.maximum(w1, w2)))
+        e = np.flatnonzero(on_edge)
+        i = np.searchsorted(self.indptr, e, side="right") - 1
+        return [(self.node_list[a], self.node_list[b]) for a, b in zip(i.tolist(), self.indices[e].tolist())]
+
+    def get_shortest_path(self, coords1, coords2, dist_func=None, edge=None, astar=True):
+        """
+            return shortest path from coords1 to coords2 as list of vertices, or [] if there is no path.
+            A* search, with the city block distance to coords2 as (admissible) heuristic, or Dijkstra if astar is False.
+            If coords1 is not a vertex, but a point on edges (p1, p2), the path starts with coords1 followed by the
+            shortest path from the end point p2 of any of these edges (both end points of a two-way edge). The edges
+            are looked up if edge is not given.
+            dist_func is accepted for compatibility with GraphTools; edge lengths are always city block lengths.
+        """
+        if coords2 not in self.node_dict:
+            return []
+        self.compile()
+
+        dst = self.node_dict[coords2]
+        if coords1 in self.node_dict:
+            src = self.node_dict[coords1]
+            _, pred = self._search([(src, 0.)], dst, astar)
+            return self._trace_path(pred, src, dst)
+
+        edges = [edge] if edge is not None else self.find_edges(coords1)
+        if len(edges)==0: return []
+
+        sources    = [(self.node_dict[p2], get_distance_city_block(coords1, p2)) for (p1, p2) in edges]
+        dist, pred = self._search(sources, dst, astar)
+        if dist[dst]==np.inf: return []
+
+        src = dst  # the end point from which the path goes on
+        while pred[src]>=0: src = pred[src]
+        return [coords1] + self._trace_path(pred, src, dst)
+
+    def get_shortest_path_tree(self, coords):
+        """
+            return (dist, pred) lists of the shortest paths from coords to all vertices (Dijkstra)
+        """
+        self.compile()
+        return self._search([(self.node_dict[coords], 0.)], -1)
+
+    def _search(self, sources, dst, astar=True):
+        # A* if dst>=0, otherwise Dijkstra over the full graph, from the (vertex, distance) pairs of sources.
+        # The number of expanded vertices is kept in n_expanded.
+        adjacency = self.__adjacency
+        coords    = self.__coords
+        n_node    = len(adjacency)
+        dist      = [np.inf]*n_node
+        pred      = [-1]*n_node
+        done      = [False]*n_node
+        astar     = astar and dst>=0
+        c_dst     = coords[dst] if dst>=0 else None
+
+        heap = []
+        for src, d_src in sources:
+            if d_src<dist[src]:
+                dist[src] = d_src
+                heapq.heappush(heap, (d_src + get_distance_city_block(coords[src], c_dst) if astar else d_src, src))
+        n_expanded = 0
+        while heap:
+            _, i = heapq.heappop(heap)
+            if done[i]: continue
+            done[i] = True
+            if i==dst: break
+
+            n_expanded += 1
+            d_i = dist[i]
+            for j, w in adjacency[i]:
+                d_j = d_i + w
+                if d_j<dist[j]:
+                    dist[j] = d_j
+                    pred[j] = i
+                    if astar:
+                        heapq.heappush(heap, (d_j + get_distance_city_block(coords[j], c_dst), j))
+                    else:
+                        heapq.heappush(heap, (d_j, j))
+
+        self.n_expanded = n_expanded
+        return dist, pred
+
+    def _trace_path(self, pred, src, dst):
+        path = [dst]
+        while path[-1]!=src:
+            i = pred[path[-1]]
+            if i<0: return []
+            path.append(i)
+        return [self.node_list[i] for i in reversed(path)]
+
+
+class PathTable:
+    """
+        Shortest paths from a fixed list of positions, computed once per source position (on first use).
+    """
+    def __init__(self, graph, pos_list, dist_func=get_distance_city_block):
+        self.graph     = graph
+        self.pos_set   = set(pos_list)
+        self.pred_dict = dict()  # source vertex -> predecessor list of its shortest path tree
+
+    def get_path(self, coords1, coords2):
+        if coords1 not in self.pos_set or coords2 not in self.graph.node_dict:
+            return self.graph.get_shortest_path(coords1, coords2)
+
+        if coords1 not in self.pred_dict:
+            self.pred_dict[coords1] = self.graph.get_shortest_path_tree(coords1)[1]
+
+        src = self.graph.node_dict[coords1]
+        dst = self.graph.node_dict[coords2]
+        return self.graph._trace_path(self.pred_dict[coords1], src, dst)
@@ -0,0 +1,227 @@
+from collections import namedtuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from XdockParams import round_coord, get_distance_city_block
+
+
+# Shortest paths within one module (destination major, as in PathMatrix). Detours through neighboring modules are
+# edges between two vertices of the module: shortcuts[u,v] = (direction, crossing out, crossing back).
+ModuleTable = namedtuple("module_table", "dist next_hop shortcuts")
+
+class HierarchicalPaths:
+    """
+        Shortest paths on a grid graph that is a chain of identical modules of width w_module (one per dock),
+        connected by edges between neighboring modules only.
+
+        Only tables of a few module sized graphs are computed: the module itself, extended with shortcuts for detours
+        through the modules to its right (right[m]), to its left (left[m]) or both (closed[m]). Near the ends of the
+        chain these tables differ, further away they are all the same.
+        A path from module m1 to module m2>m1 crosses each boundary in between for the last time via one of its
+        right crossing edges, after which it stays to the right of it. Between two last crossings, the length is in
+        a transfer matrix of right[m], and the min plus powers of this matrix give the length over any number of
+        modules. The same holds for paths to the left. The build time and memory are therefore independent of the
+        number of modules, except for the powers (a few crossings squared, per module).
+
+        Same interface as PathMatrix: has_node(), get_distance(), get_path().
+    """
+    def __init__(self, grid_graph, n_module, w_module):
+        self.n_module = n_module
+        self.w_module = w_module
+
+        # Split vertices in modules, with local coordinates relative to their module
+        self.node_dict = dict()  # vertex -> (module, local index)
+        self.node_list = [[] for _ in range(n_module)] # vertices of each module, in local index order
+        local_dict     = dict()  # local coordinates -> local index
+        for p in sorted(grid_graph.node_list, key=lambda p: (self.__get_module(p), self.__get_local_coords(p))):
+            m = self.__get_module(p)
+            q = self.__get_local_coords(p)
+            if m==0: local_dict[q] = len(local_dict)
+            if q not in local_dict:
+                raise ValueError(f"HierarchicalPaths(). Module {m} differs from module 0 at {p}")
+            self.node_dict[p] = (m, local_dict[q])
+            self.node_list[m].append(p)
+
+        self.n_local = len(local_dict)
+        if any(len(node_list)!=self.n_local for node_list in self.node_list):
+            raise ValueError("HierarchicalPaths(). Modules have different numbers of vertices")
+
+        # Local edges and crossing edges, which must be the same for each module (boundary)
+        local_edges = [set() for _ in range(n_module)]
+        cross_edges = {1: [set() for _ in range(n_module)], -1: [set() for _ in range(n_module)]}
+        for (p1, p2) in grid_graph.get_edge_list():
+            (m1, k1), (m2, k2) = self.node_dict[p1], self.node_dict[p2]
+            if m1==m2:
+                local_edges[m1].add((k1, k2))
+            elif abs(m2-m1)==1:
+                cross_edges[m2-m1][min(m1, m2)].add((k1, k2))
+            else:
+                raise ValueError(f"HierarchicalPaths(). Edge {p1}, {p2} connects modules {m1} and {m2}")
+
+        if any(edges!=local_edges[0] for edges in local_edges):
+            raise ValueError("HierarchicalPaths(). Modules have different local edges")
+        for direction in (1, -1):
+            if any(edges!=cross_edges[direction][0] for edges in cross_edges[direction][:n_module-1]):
+                raise ValueError("HierarchicalPaths(). Module boundaries have different edges")
+
+        nodes            = self.node_list[0]
+        self.local_edges = [(k1, k2, get_distance_city_block(nodes[k1], nodes[k2])) for (k1, k2) in sorted(local_edges[0])]
+
+        # Crossing edges to the right (+1) and to the left (-1), from exit vertex to entry vertex of the next module
+        self.cross = dict()  # direction -> (exit vertices, entry vertices, edge lengths)
+        for direction in (1, -1):
+            edges   = sorted(cross_edges[direction][0])
+            nodes_1 = self.node_list[0 if direction>0 else 1] if n_module>1 else []
+            nodes_2 = self.node_list[1 if direction>0 else 0] if n_module>1 else []
+            self.cross[direction] = np.array([e for (e, i) in edges], int), \
+                                    np.array([i for (e, i) in edges], int), \
+                                    np.array([get_distance_city_block(nodes_1[e], nodes_2[i]) for (e, i) in edges])
+
+        # Module tables, from the ends of the chain until they no longer change
+        local      = self.__get_table([])
+        self.right = self.__get_region_tables(1 , local)
+        self.left  = self.__get_region_tables(-1, local)
+
+        table_dict  = dict()
+        self.closed = []
+        for m in range(n_module):
+            key = (id(self.right[m+1]) if m<n_module-1 else None, id(self.left[m-1]) if m>0 else None)
+            if key not in table_dict:
+                shortcuts = []
+                if m<n_module-1: shortcuts += self.__get_shortcuts( 1, self.right[m+1])
+                if m>0         : shortcuts += self.__get_shortcuts(-1, self.left [m-1])
+                table_dict[key] = self.__get_table(shortcuts)
+            self.closed.append(table_dict[key])
+
+        # Transfer matrices between last crossings and their min plus powers, for both directions
+        self.power  = dict()  # direction -> list of min plus powers of the transfer matrix
+        self.argmin = dict()  # direction -> list of the last but one crossing of each power
+        for direction in (1, -1):
+            exits, entries, lengths = self.cross[direction]
+            inner  = self.right[:n_module-1] if direction>0 else self.left[1:]
+            if any(table is not inner[0] for table in inner):
+                raise ValueError("HierarchicalPaths(). Module tables do not converge")
+
+            n_cross  = len(lengths)
+            transfer = inner[0].dist[exits[None,:], entries[:,None]] + lengths[None,:] if n_cross>0 else None
+            power    = [np.where(np.eye(n_cross, dtype=bool), 0., np.inf)]
+            argmin   = [np.tile(np.arange(n_cross), (n_cross, 1))]
+            for _ in range(n_module-2):
+                total = power[-1][:,:,None] + transfer[None,:,:]
+                argmin.append(np.argmin(total, axis=1))
+                power .append(np.min   (total, axis=1))
+            self.power [direction] = power
+            self.argmin[direction] = argmin
+
+    def __get_module(self, p):
+        return min(self.n_module-1, max(0, int(p[0]//self.w_module)))
+
+    def __get_local_coords(self, p):
+        return round_coord(p[0] - self.__get_module(p)*self.w_module), round_coord(p[1])
+
+    def __get_region_tables(self, direction, local):
+        # Tables of each module, with detours to the modules at the given side of it
+        tables = [local]*self.n_module
+        order  = range(self.n_module-2, -1, -1) if direction>0 else range(1, self.n_module)
+        for m in order:
+            outer = tables[m+direction]
+            if outer is not local and outer is tables[m+2*direction]:
+                tables[m] = outer # converged
+                continue
+
+            table = self.__get_table(self.__get_shortcuts(direction, outer))
+            if np.array_equal(table.dist, outer.dist) and np.array_equal(table.next_hop, outer.next_hop):
+                table = outer
+            tables[m] = table
+        return tables
+
+    def __get_shortcuts(self, direction, outer):
+        # Detours from a module to its neighbor at the given side and back, with outer the table of the neighbor
+        exits_out, entries_out, lengths_out = self.cross[ direction]
+        exits_in , entries_in , lengths_in  = self.cross[-direction]
+        shortcuts = []
+        for x in range(len(lengths_out)):
+            for y in range(len(lengths_in)):
+                d = lengths_out[x] + outer.dist[exits_in[y], entries_out[x]] + lengths_in[y]
+                if d<np.inf:
+                    shortcuts.append((exits_out[x], entries_in[y], d, (direction, x, y)))
+        return shortcuts
+
+    def __get_table(self, shortcuts):
+        # All pairs shortest paths in the module, with local edges and shortcuts (the shortest one of each pair)
+        edges = dict(((k1, k2), (d, None)) for (k1, k2, d) in self.local_edges)
+        for (k1, k2, d, detour) in shortcuts:
+            if (k1, k2) not in edges or d<edges[k1, k2][0]:
+                edges[k1, k2] = (d, detour)
+
+        k1, k2  = np.array(list(edges.keys()), int).reshape(-1, 2).T
+        d       = np.array([d for (d, detour) in edges.values()], float)
+        reverse = csr_matrix((d, (k2, k1)), shape=(self.n_local, self.n_local))
+        dist, pred = dijkstra(reverse, directed=True, return_predecessors=True)
+        shortcuts  = dict((pair, detour) for (pair, (d, detour)) in edges.items() if detour is not None)
+        return ModuleTable(dist, pred.astype(np.int32), shortcuts)
+
+    def has_node(self, coords):
+        return coords in self.node_dict
+
+    def __get_crossings(self, m1, k1, m2, k2):
+        # return (distance, first crossing, last crossing) from vertex k1 in module m1 to vertex k2 in module m2
+        direction               = 1 if m2>m1 else -1
+        exits, entries, lengths = self.cross[direction]
+        region   = self.right if direction>0 else self.left
+        dist_out = self.closed[m1].dist[exits, k1] + lengths  # to the first module boundary
+        dist_in  = region[m2].dist[k2, entries]               # from the last module boundary
+        total    = dist_out[:,None] + self.power[direction][abs(m2-m1)-1] + dist_in[None,:]
+        x, y     = np.unravel_index(np.argmin(total), total.shape)
+        return total[x, y], x, y
+
+    def get_distance(self, coords1, coords2):
+        m1, k1 = self.node_dict[coords1]
+        m2, k2 = self.node_dict[coords2]
+        if m1==m2:
+            return float(self.closed[m1].dist[k2, k1])
+        return float(self.__get_crossings(m1, k1, m2, k2)[0])
+
+    def get_path(self, coords1, coords2):
+        m1, k1 = self.node_dict[coords1]
+        m2, k2 = self.node_dict[coords2]
+        if m1==m2:
+            return self.__get_module_path(self.closed[m1], m1, k1, k2)
+
+        dist, x, y = self.__get_crossings(m1, k1, m2, k2)
+        if dist==np.inf: return []
+
+        # Last crossings of the module boundaries, from the last to the first one
+        direction      = 1 if m2>m1 else -1
+        exits, entries = self.cross[direction][:2]
+        region         = self.right if direction>0 else self.left
+        crossings      = [y]
+        for n in range(abs(m2-m1)-1, 0, -1):
+            crossings.append(self.argmin[direction][n][x, crossings[-1]])
+        crossings.reverse()
+
+        path, table, m, k = [], self.closed[m1], m1, k1
+        for c in crossings:
+            path += self.__get_module_path(table, m, k, exits[c])
+            m    += direction
+            k     = entries[c]
+            table = region[m]
+        return path + self.__get_module_path(table, m, k, k2)
+
+    def __get_module_path(self, table, m, k1, k2):
+        next_hop = table.next_hop[k2]
+        path     = [self.node_list[m][k1]]
+        while k1!=k2:
+            k = next_hop[k1]
+            if k<0: return []
+
+            if (k1, k) in table.shortcuts:
+                # Detour through the neighboring module
+                direction, x, y = table.shortcuts[k1, k]
+                outer = (self.right if direction>0 else self.left)[m+direction]
+                path += self.__get_module_path(outer, m+direction, self.cross[direction][1][x], self.cross[-direction][0][y])
+            path.append(self.node_list[m][k])
+            k1 = k
+        return path
@@ -1,9 +1,17 @@
+import hashlib
+
 from XdockParams import W_BUFFER_COMP, H_BUFFER_COMP, W_DOCK, W_ROLL_CONTAINER, H_ROLL_CONTAINER, H_LANE_STORE, \
-                        H_FRONT, H_PARK, H_RIGHT, H_LEFT
+                        H_FRONT, H_PARK, H_RIGHT, H_LEFT, W_LANE, W_PARK_PLACE, N_LANE
+
+# Version of the floor plan graph and path tables in the cache; increase it when their construction changes
+CACHE_VERSION = 2
+
 
+def get_log_filename(base_name, tag=""):
+    return ModelParams.DATA_DIR + ModelParams.LOG_SUB_DIR + ModelParams.hash_code + tag + "_"+base_name + ".log"
 
-def get_log_filename(base_name):
-    return ModelParams.DATA_DIR + ModelParams.LOG_SUB_DIR + ModelParams.hash_code + "_"+base_name + ".log"
+def get_cache_filename(base_name, ext=".npz"):
+    return ModelParams.DATA_DIR + ModelParams.CACHE_SUB_DIR + ModelParams.layout_hash + "_"+base_name + ext
 
 def get_video_dir():
     return ModelParams.DATA_DIR + ModelParams.VIDEO_SUB_DIR
@@ -19,9 +27,27 @@ def get_model_params():
            + f"{ModelParams.ROBOT_SPEED=}\n" \
            + f"{ModelParams.ROBOT_LOAD_TIME}\n" \
            + f"{ModelParams.ROBOT_UNLOAD_TIME}\n" \
-           + f"{ModelParams.BUFFER_LANE_SPEED}\n"
+           + f"{ModelParams.BUFFER_LANE_SPEED}\n" \
+           + f"{ModelParams.DISPATCHER=}\n"
     return text
 
+def get_layout_params():
+    # All parameters that determine the geometry of the floor plan and its grid graph
+    text = f"{CACHE_VERSION=}\n" \
+           + f"{ModelParams.N_DOCK=}\n" \
+           + f"{ModelParams.N_BUFFER_STORE=}\n" \
+           + f"{ModelParams.N_BUFFER_ROW=}\n" \
+           + f"{ModelParams.N_BUFFER_COL=}\n" \
+           + f"{ModelParams.MAX_LANE_STORE=}\n" \
+           + f"{ModelParams.N_PARK_ROW=}\n" \
+           + f"{W_BUFFER_COMP=} {H_BUFFER_COMP=} {W_DOCK=} {W_ROLL_CONTAINER=} {H_ROLL_CONTAINER=} {H_LANE_STORE=}\n" \
+           + f"{H_FRONT=} {H_PARK=} {H_RIGHT=} {H_LEFT=} {W_LANE=} {W_PARK_PLACE=} {N_LANE=}\n"
+    return text
+
+def get_hash(text):
+    # Same value in every process (unlike hash())
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
 class ModelParams:
     # Independent parameters:
     N_BUFFER_STORE  =  3
@@ -39,11 +65,17 @@ class ModelParams:
 
     BUFFER_LANE_SPEED = 0.3
 
+    DISPATCHER        = "greedy"  # robot selection for new jobs: "greedy" (per dock) or "assignment" (all docks at once)
+
     # Input file/dir
     DATA_DIR        = "C:/Users/MunckJande/OneDrive - PostNL/Documenten/Projecten/Robots_at_Xdocks/"
     LOG_SUB_DIR     = "Logging/"
     VIDEO_SUB_DIR   = "Video/"
     DATA_FILE       = "Transport_summary.xlsx"
+    CACHE_SUB_DIR   = "Cache/"
+    PATH_CACHE      = True
+    PATH_MEMMAP     = False  # path tables as memory mapped files in the cache (for large floor plans)
+    PATH_HIERARCHICAL = False  # path tables per dock module instead of for the whole floor plan (for many docks)
 
     # Dependent parameters, to be set by self.__update()
     W_BUFFER_STORE  = 0.
@@ -58,6 +90,7 @@ class ModelParams:
     H_MANEUVER      = 0.
 
     hash_code       = ""
+    layout_hash     = ""
 
     TIME_LOAD_BUFFER_LANE = 0.
 
@@ -82,7 +115,17 @@ class ModelParams:
 
         ModelParams.TIME_LOAD_BUFFER_LANE = H_ROLL_CONTAINER / ModelParams.BUFFER_LANE_SPEED
 
-        ModelParams.hash_code  = str(abs(hash(get_model_params())))
+        ModelParams.hash_code   = get_hash(get_model_params())
+        ModelParams.layout_hash = get_hash(get_layout_params())
+
+    def get_params(self):
+        # Copy of all parameters, to be restored with set_params()
+        return dict((key, value) for (key, value) in vars(ModelParams).items() if key.isupper())
+
+    def set_params(self, params):
+        for key, value in params.items():
+            setattr(ModelParams, key, value)
+        self.__update()
 
     def set_n_buffer_store(self, n_store):
         ModelParams.N_BUFFER_STORE = n_store
@@ -123,6 +166,19 @@ class ModelParams:
         sub_dir = sub_dir.replace('\\','/')
         ModelParams.LOG_SUB_DIR = sub_dir.split('/')[-1] + '/'
 
+    def set_cache_sub_dir(self, sub_dir):
+        sub_dir = sub_dir.replace('\\', '/')
+        ModelParams.CACHE_SUB_DIR = sub_dir.split('/')[-1] + '/'
+
+    def set_path_cache(self, use_cache):
+        ModelParams.PATH_CACHE = use_cache
+
+    def set_path_memmap(self, use_memmap):
+        ModelParams.PATH_MEMMAP = use_memmap
+
+    def set_path_hierarchical(self, use_hierarchical):
+        ModelParams.PATH_HIERARCHICAL = use_hierarchical
+
     def set_video_sub_dir(self, sub_dir):
         sub_dir = sub_dir.replace('\\', '/')
         ModelParams.VIDEO_SUB_DIR = sub_dir.split('/')[-1] + '/'
@@ -134,6 +190,13 @@ class ModelParams:
         ModelParams.ROBOT_LOAD_TIME   = t_load
         ModelParams.ROBOT_UNLOAD_TIME = t_unload
 
+    def set_dispatcher(self, dispatcher):
+        if dispatcher not in ["greedy", "assignment"]:
+            print("ERROR: ModelParams.set_dispatcher(). Unknown dispatcher: ", dispatcher)
+            return
+        ModelParams.DISPATCHER = dispatcher
+        self.__update()
+
     def set_buffer_lane_speed(self, speed):
         ModelParams.BUFFER_LANE_SPEED = speed
         self.__update()
\ No newline at end of file
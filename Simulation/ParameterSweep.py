@@ -0,0 +1,162 @@
+import io
+import os
+import csv
+import json
+import time
+import argparse
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from Simulation import Simulation, AbortCriteria
+
+from ModelParameters import ModelParams as M
+from ModelParameters import get_hash
+
+
+# Columns of the sweep table, after the setter names of the grid. error: exception of a run that failed
+RESULT_COLUMNS = ["nrc_in_buffer_store", "nrc_in_buffer_lane", "nrc_not_unloaded", "n_trucks_not_unloaded",
+                  "trucks_not_unloaded", "n_error", "abort_reason", "t_end_h", "run_time_s", "error"]
+
+
+def get_grid_points(grid):
+    """
+        return all points of grid, a dict of ModelParams setter name -> list of values, as dicts setter name -> value.
+        Setters with more than one argument get a list or tuple of arguments per value, e.g.
+        {"set_n_robot": [24, 32], "set_n_buffer_row_col": [(8, 3), (10, 3)]}
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def get_point_key(point):
+    return json.dumps(point, sort_keys=True)
+
+def get_sweep_hash(base_params, simulate, x_dock_name, abort_criteria):
+    # hash of all settings of a sweep other than its grid points; results of other settings are not reused
+    return get_hash(repr((sorted(base_params.items()), simulate, x_dock_name, abort_criteria)))
+
+def set_point_params(point):
+    params = M()
+    for name, value in point.items():
+        if not name.startswith("set_") or not hasattr(params, name):
+            raise ValueError(f"set_point_params(). Unknown ModelParams setter: {name}")
+        if isinstance(value, (list, tuple)): getattr(params, name)(*value)
+        else:                                getattr(params, name)(value)
+
+def run_point(base_params, point, simulate=True, x_dock_name="C_TL", abort_criteria=None, seed=None, arrival_jitter=0.):
+    """
+        Run one headless simulation with base_params (from ModelParams.get_params()) changed by the setters of point
+        and return its row of the sweep table. Runs in a worker process.
+        With abort_criteria (AbortCriteria) hopeless runs are stopped early, with the reason in column abort_reason.
+        seed and arrival_jitter select the random truck plan (see TruckPlan).
+    """
+    M().set_params(base_params)
+    set_point_params(point)
+
+    # The simulation prints its truck planning and errors: only count the errors
+    t0  = time.perf_counter()
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        sim     = Simulation(simulate, x_dock_name, event_driven=True, abort_criteria=abort_criteria, seed=seed,
+                             arrival_jitter=arrival_jitter)
+        results = sim.run()
+
+    row = dict(key=get_point_key(point))
+    row.update((name, json.dumps(value)) for (name, value) in point.items())
+    row.update(nrc_in_buffer_store   = results.nrc_in_buffer_store,
+               nrc_in_buffer_lane    = results.nrc_in_buffer_lane,
+               nrc_not_unloaded      = results.nrc_not_unloaded,
+               n_trucks_not_unloaded = len(results.trucks_not_unloaded),
+               trucks_not_unloaded   = ";".join(results.trucks_not_unloaded),
+               n_error               = sum(line.startswith("ERROR") for line in out.getvalue().split("\n")),
+               abort_reason          = sim.abort_reason,
+               t_end_h               = round(sim.floor_plan.time_sec/3600, 2),
+               run_time_s            = round(time.perf_counter()-t0, 1),
+               error                 = "")
+    return row
+
+def get_result_row(future, point):
+    # return the row of a finished run_point() of point, or a row with its error if the run raised an exception
+    try:
+        return future.result()
+    except Exception as error:
+        print(f"ERROR: run_point(). {get_point_key(point):s} failed: {type(error).__name__}: {error}")
+        row = dict(key=get_point_key(point), error=f"{type(error).__name__}: {error}")
+        row.update((name, json.dumps(value)) for (name, value) in point.items())
+        return row
+
+def run_sweep(grid, out_file, simulate=True, x_dock_name="C_TL", max_workers=None, abort_criteria=None):
+    """
+        Run all points of grid (see get_grid_points()) in parallel, with the current model parameters for all other
+        parameters, and return the sweep table as DataFrame.
+        Each finished point is appended to the csv file out_file, and points already in it without error are not run
+        again, such that an interrupted sweep can be resumed. The file can only be resumed with the same model
+        parameters, truck plan and abort criteria (column sweep_hash).
+    """
+    points      = get_grid_points(grid)
+    columns     = ["key", "sweep_hash"] + list(grid) + RESULT_COLUMNS
+    base_params = M().get_params()
+    sweep_hash  = get_sweep_hash(base_params, simulate, x_dock_name, abort_criteria)
+
+    new_file = not os.path.isfile(out_file) or os.path.getsize(out_file)==0
+    done     = set()
+    if not new_file:
+        df_done = pd.read_csv(out_file, dtype=str, keep_default_na=False)
+        if "sweep_hash" not in df_done or (df_done["sweep_hash"]!=sweep_hash).any():
+            raise ValueError(f"run_sweep(). {out_file} has results of other model parameters, truck plan or abort criteria")
+        done = set(df_done.loc[df_done["error"]=="", "key"])
+    todo = [point for point in points if get_point_key(point) not in done]
+    print(f"sweep: {len(points):d} points, {len(points)-len(todo):d} done before, {len(todo):d} to run")
+
+    t0 = time.perf_counter()
+    with open(out_file, "a", newline="") as fp:
+        writer = csv.DictWriter(fp, fieldnames=columns, extrasaction="ignore")
+        if new_file: writer.writeheader()
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = dict((executor.submit(run_point, base_params, point, simulate, x_dock_name, abort_criteria), point) for point in todo)
+            for n, future in enumerate(as_completed(futures), start=1):
+                row = get_result_row(future, futures[future])
+                row.update(sweep_hash=sweep_hash)
+                writer.writerow(row)
+                fp.flush()
+
+                dt = time.perf_counter()-t0
+                print(f"sweep: {n:d}/{len(todo):d} {row['key']:s} ({dt:.0f} s, {dt*(len(todo)-n)/n:.0f} s to go)")
+
+    # The last row of a point is its result, after earlier failed runs
+    df = pd.read_csv(out_file).drop_duplicates("key", keep="last")
+    return df[df["key"].isin([get_point_key(point) for point in points])].reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel parameter sweep of headless cross dock simulations")
+    parser.add_argument("grid", help='parameter grid as json, e.g. \'{"set_n_robot": [24, 32], "set_n_buffer_row_col": [[8, 3], [10, 3]]}\'')
+    parser.add_argument("--out", default="sweep.csv", help="csv file with the results, also used to resume a sweep")
+    parser.add_argument("--simulate", action="store_true", help="use the simulated truck plan instead of the transport scheme")
+    parser.add_argument("--x-dock", default="C_TL", help="cross dock name in the transport scheme")
+    parser.add_argument("--data-dir", default=M.DATA_DIR, help="directory with input file and logging sub directory")
+    parser.add_argument("--data-file", default=M.DATA_FILE, help="transport scheme (excel)")
+    parser.add_argument("--robot-logging", action="store_true")
+    parser.add_argument("--abort-not-unloaded", type=int, default=None, help="stop a run when more roll containers are left on departed inbound trucks")
+    parser.add_argument("--abort-backlog", type=int, default=None, help="stop a run when more roll containers wait on inbound trucks and incoming lanes")
+    parser.add_argument("--abort-overflow", action="store_true", help="stop a run at a buffer overflow")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of cores)")
+    args = parser.parse_args()
+
+    params = M()
+    params.set_data_dir(args.data_dir)
+    params.set_data_input_file(args.data_file)
+    params.set_robot_logging(args.robot_logging)
+
+    criteria = AbortCriteria(args.abort_not_unloaded, args.abort_backlog, args.abort_overflow)
+    if criteria==AbortCriteria(): criteria = None
+
+    df = run_sweep(json.loads(args.grid), args.out, args.simulate, args.x_dock, args.workers, criteria)
+    print(df.drop(columns=["key"]).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import cv2 as cv
 from XdockParams import W_DOCK, H_LEFT, H_RIGHT, H_FRONT, H_PARK, W_PARK_PLACE, \
                         round_coords
 from ModelParameters import ModelParams as M
@@ -50,6 +49,7 @@ class Parking:
         return [self.get_grid_coords(park) for park in range(self.get_n_parking())]
 
     def draw(self, floor_plan):
+        import cv2 as cv
         pt1 = floor_plan.pnt_from_coords(self.w1, self.h1)
         pt2 = floor_plan.pnt_from_coords(self.w2, self.h2)
 
@@ -59,6 +59,7 @@ class Parking:
             floor_plan.figure = cv.circle(floor_plan.figure, pnt, 5, (0,0,180), -1)
 
     def draw_circulation(self, floor_plan):
+        import cv2 as cv
         pt1 = floor_plan.pnt_from_coords(self.w1, self.h1_ext)
         pt2 = floor_plan.pnt_from_coords(self.w2, self.h1_ext)
         floor_plan.figure = cv.arrowedLine(floor_plan.figure, pt1, pt2, (0, 200, 0), 3)
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from GridGraph import DiGraph
+
+
+class PathMatrix:
+    """
+        All pairs shortest path lengths and next hops for the vertices of a directed grid graph (GridGraph.DiGraph),
+        with the same vertex IDs as the graph. Rows are destinations, such that a path is traced along one row:
+        dist[j,i]     : length of the shortest path from vertex i to vertex j (inf if there is no path)
+        next_hop[j,i] : vertex following i on the shortest path from i to j (<0 if there is no path)
+        The arrays can also be read only memory maps (see create_path_memmap()), with float32 distances.
+    """
+    def __init__(self, grid_graph, dist=None, next_hop=None):
+        grid_graph.compile()
+        self.node_list = grid_graph.node_list
+        self.node_dict = grid_graph.node_dict
+        if dist is not None:
+            self.dist     = dist
+            self.next_hop = next_hop
+            return
+
+        n_node        = len(self.node_list)
+        self.dist     = np.empty((n_node, n_node), float)
+        self.next_hop = np.empty((n_node, n_node), np.int32)
+        compute_path_tables(grid_graph, self.dist, self.next_hop)
+
+    def has_node(self, coords):
+        return coords in self.node_dict
+
+    def get_distance(self, coords1, coords2):
+        return float(self.dist[self.node_dict[coords2], self.node_dict[coords1]])
+
+    def get_path(self, coords1, coords2):
+        i        = self.node_dict[coords1]
+        j        = self.node_dict[coords2]
+        next_hop = self.next_hop[j]
+        path     = [coords1]
+        while i!=j:
+            i = next_hop[i]
+            if i<0: return []
+            path.append(self.node_list[i])
+        return path
+
+
+def compute_path_tables(grid_graph, dist, next_hop):
+    """
+        Fill dist and next_hop (arrays or memory maps of n_node x n_node) with the shortest paths of grid_graph.
+    """
+    # Dijkstra from each destination j on the reversed graph, in blocks of destinations to limit the memory
+    # use: the predecessor of vertex i on the reversed path from j is the next hop of i on the path to j.
+    grid_graph.compile()
+    n_node  = grid_graph.get_n_nodes()
+    graph   = csr_matrix((grid_graph.weights, grid_graph.indices, grid_graph.indptr), shape=(n_node, n_node))
+    reverse = graph.T.tocsr()
+    n_block = max(1, 2**24//max(1, n_node))
+    for j in range(0, n_node, n_block):
+        block = np.arange(j, min(j+n_block, n_node))
+        dist_rev, pred_rev = dijkstra(reverse, directed=True, indices=block, return_predecessors=True)
+        dist    [block] = dist_rev
+        next_hop[block] = pred_rev
+
+def save_path_cache(file_name, grid_graph, path_matrix=None):
+    # Write to a temporary file first, such that other processes never read a partially written cache file
+    coords, indptr, indices = grid_graph.get_arrays()
+    arrays = dict(coords=coords, indptr=indptr, indices=indices)
+    if path_matrix is not None:
+        arrays.update(dist=path_matrix.dist, next_hop=path_matrix.next_hop)
+
+    tmp_name = f"{file_name}.{os.getpid()}.tmp"
+    with open(tmp_name, "wb") as fp:
+        np.savez(fp, **arrays)
+    os.replace(tmp_name, file_name)
+
+def load_path_cache(file_name, dist=None, next_hop=None):
+    """
+        return (grid_graph, path_matrix) from a file written by save_path_cache(), using dist and next_hop
+        instead of the path tables in the file if they are given
+    """
+    with np.load(file_name) as data:
+        grid_graph = DiGraph.from_arrays(data["coords"], data["indptr"], data["indices"])
+        if dist is None:
+            dist, next_hop = data["dist"], data["next_hop"]
+        return grid_graph, PathMatrix(grid_graph, dist, next_hop)
+
+def create_path_memmap(dist_file, next_hop_file, grid_graph):
+    """
+        Compute the path tables of grid_graph directly into .npy files (float32 distances, int32 next hops),
+        which several processes can map read only with load_path_memmap().
+    """
+    n_node    = grid_graph.get_n_nodes()
+    tmp_names = [f"{file_name}.{os.getpid()}.tmp" for file_name in (dist_file, next_hop_file)]
+    try:
+        dist     = open_memmap(tmp_names[0], mode="w+", dtype=np.float32, shape=(n_node, n_node))
+        next_hop = open_memmap(tmp_names[1], mode="w+", dtype=np.int32,   shape=(n_node, n_node))
+        compute_path_tables(grid_graph, dist, next_hop)
+        dist.flush()
+        next_hop.flush()
+        del dist, next_hop
+    except BaseException:
+        for tmp_name in tmp_names:
+            if os.path.isfile(tmp_name): os.remove(tmp_name)
+        raise
+
+    os.replace(tmp_names[0], dist_file)
+    os.replace(tmp_names[1], next_hop_file)
+
+def load_path_memmap(dist_file, next_hop_file):
+    return np.load(dist_file, mmap_mode="r"), np.load(next_hop_file, mmap_mode="r")
@@ -0,0 +1,114 @@
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from ParameterSweep import get_grid_points, get_point_key, run_point, get_result_row
+
+from ModelParameters import ModelParams as M
+
+
+# Results of FloorPlan.log_results() that are summarized over the replications
+KPI_COLUMNS = ["nrc_in_buffer_store", "nrc_in_buffer_lane", "nrc_not_unloaded", "n_trucks_not_unloaded"]
+
+
+def get_replication_seeds(base_seed, n_replication):
+    """
+        return the seeds of n_replication independent truck plans. Every configuration gets the same seeds, such that
+        configurations are compared on the same truck plans (common random numbers).
+    """
+    return [int(seq.generate_state(1)[0]) for seq in np.random.SeedSequence(base_seed).spawn(n_replication)]
+
+def get_confidence_interval(values, confidence=0.95):
+    # return mean and half width of its confidence interval (Student t, NaN for less than two values)
+    values = np.asarray(values, float)
+    if len(values)==0: return np.nan, np.nan
+    if len(values)<2: return float(values.mean()), np.nan
+    return float(values.mean()), float(stats.t.ppf((1+confidence)/2, len(values)-1) * stats.sem(values))
+
+def summarize_replications(runs, points, confidence=0.95):
+    """
+        return per point the mean and confidence interval half width (ci_) of each KPI, and of the paired difference
+        (diff_) of each KPI with the first point, as DataFrame. The pairs are the runs with the same seed. Runs that
+        failed (see ParameterSweep.get_result_row()) are left out and counted in n_failed.
+    """
+    failed  = runs["error"]!=""
+    n_fail  = runs[failed].groupby("key").size()
+    empty   = pd.DataFrame(columns=["seed"]+KPI_COLUMNS).set_index("seed")
+    by_key  = dict((key, df.set_index("seed")) for (key, df) in runs[~failed].groupby("key"))
+    first   = by_key.get(get_point_key(points[0]), empty)
+    summary = []
+    for point in points:
+        df  = by_key.get(get_point_key(point), empty)
+        row = dict(((name, json.dumps(value)) for (name, value) in point.items()), n_replication=len(df),
+                   n_failed=int(n_fail.get(get_point_key(point), 0)))
+        for kpi in KPI_COLUMNS:
+            row[kpi], row["ci_"+kpi] = get_confidence_interval(df[kpi], confidence)
+        if point is not points[0]:
+            seeds = df.index.intersection(first.index)
+            for kpi in KPI_COLUMNS:
+                row["diff_"+kpi], row["ci_diff_"+kpi] = get_confidence_interval(df.loc[seeds, kpi]-first.loc[seeds, kpi], confidence)
+        summary.append(row)
+    return pd.DataFrame(summary)
+
+def run_replications(grid, n_replication, simulate=True, x_dock_name="C_TL", base_seed=0, arrival_jitter=0.,
+                     confidence=0.95, max_workers=None):
+    """
+        Run n_replication random truck plans (see TruckPlan) for each point of grid (see ParameterSweep.get_grid_points(),
+        {} for the current model parameters) in parallel, and return the table of all runs and its summary (see
+        summarize_replications()) as DataFrames.
+        arrival_jitter: standard deviation (s) of the random shift of each truck in time
+    """
+    points      = get_grid_points(grid)
+    seeds       = get_replication_seeds(base_seed, n_replication)
+    base_params = M().get_params()
+    rows        = []
+    t0          = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = dict((executor.submit(run_point, base_params, point, simulate, x_dock_name, None, seed, arrival_jitter), (point, seed))
+                       for point in points for seed in seeds)
+        for n, future in enumerate(as_completed(futures), start=1):
+            point, seed = futures[future]
+            row         = get_result_row(future, point)
+            row.update(seed=seed)
+            rows.append(row)
+
+            dt = time.perf_counter()-t0
+            print(f"replications: {n:d}/{len(futures):d} {row['key']:s} ({dt:.0f} s, {dt*(len(futures)-n)/n:.0f} s to go)")
+
+    runs = pd.DataFrame(rows)
+    return runs, summarize_replications(runs, points, confidence)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replications of headless cross dock simulations with random truck plans")
+    parser.add_argument("--grid", default="{}", help='configurations to compare as json, e.g. \'{"set_n_robot": [24, 32]}\'')
+    parser.add_argument("--replications", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the replication seeds")
+    parser.add_argument("--arrival-jitter", type=float, default=0., help="standard deviation (s) of the truck arrival times")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--out", default=None, help="csv file with all runs")
+    parser.add_argument("--simulate", action="store_true", help="use the simulated truck plan instead of the transport scheme")
+    parser.add_argument("--x-dock", default="C_TL", help="cross dock name in the transport scheme")
+    parser.add_argument("--data-dir", default=M.DATA_DIR, help="directory with input file and logging sub directory")
+    parser.add_argument("--data-file", default=M.DATA_FILE, help="transport scheme (excel)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of cores)")
+    args = parser.parse_args()
+
+    params = M()
+    params.set_data_dir(args.data_dir)
+    params.set_data_input_file(args.data_file)
+    params.set_robot_logging(False)
+
+    runs, summary = run_replications(json.loads(args.grid), args.replications, args.simulate, args.x_dock, args.seed,
+                                     args.arrival_jitter, args.confidence, args.workers)
+    if args.out: runs.to_csv(args.out, index=False)
+    print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
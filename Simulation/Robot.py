@@ -1,46 +1,93 @@
-from collections import defaultdict, Counter
-import cv2 as cv
+import math
+
+import numpy as np
 
 
 from XdockParams import TIME_STEP_S,  \
                         W1_ROBOT, W2_ROBOT, H1_ROBOT, H2_ROBOT, \
                         LOG_INTERVAL_ROBOT,\
-                        get_orientation, get_distance_city_block, get_path_len
+                        EPS
 from ModelParameters import ModelParams as M
-from ModelParameters import get_log_filename
-
-from BufferStoreManager import BufferStoreManager
 
 
-BSM = BufferStoreManager()
+class PathNotFoundError(RuntimeError):
+    # A robot cannot get to the goal of its goto task (the run cannot go on)
+    pass
 
 def print_tasks(task_list):
     for t,task in enumerate(task_list):
         print(t, task.task_type)
 
+class RobotPath:
+    """
+        Path of a robot as arrays of its vertices, the cumulative arc length at each vertex and the orientation of
+        each segment (the orientation of the previous segment for segments of zero length).
+        The robot position at arc length s is found with a binary search, when s is beyond the current segment.
+    """
+    def __init__(self, path):
+        self.vertices = np.array(path, float).reshape(-1, 2)
+        dw, dh        = np.diff(self.vertices, axis=0).T
+        self.arc      = np.concatenate(([0.], np.cumsum(np.abs(dw) + np.abs(dh))))
+        self.length   = float(self.arc[-1])
+
+        orientation   = np.where(np.abs(dh)<EPS, np.where(dw>0, 0, 2), np.where(dh>0, 1, 3))
+        orientation[(dw==0.) & (dh==0.)] = -1
+        for i in range(1, len(orientation)):
+            if orientation[i]<0: orientation[i] = orientation[i-1]
+        self.orientation = orientation
+
+        self.end = path[-1]
+        self.__set_segment(0)
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def __set_segment(self, i):
+        # Current segment, as Python scalars for fast access in get_position()
+        i = min(i, max(0, len(self.vertices)-2))
+        self.segment   = i
+        self.arc_begin = float(self.arc[i])
+        self.arc_end   = float(self.arc[i+1]) if i+1<len(self.arc) else self.arc_begin
+        self.w, self.h = self.vertices[i].tolist()
+        self.o         = int(self.orientation[i]) if len(self.orientation)>0 else -1
+
+    def get_position(self, s):
+        """
+            return (coordinates, orientation) at arc length s<length (orientation<0 if not defined)
+        """
+        # Arc lengths within EPS of a vertex are at that vertex, to avoid round off effects of the summed steps
+        if not self.arc_begin<=s+EPS<self.arc_end:
+            self.__set_segment(int(np.searchsorted(self.arc, s+EPS, side="right"))-1)
+
+        ds = s - self.arc_begin if s-self.arc_begin>EPS else 0.
+        if self.o==0: return (self.w + ds, self.h), 0
+        if self.o==1: return (self.w, self.h + ds), 1
+        if self.o==2: return (self.w - ds, self.h), 2
+        return (self.w, self.h - ds), self.o
+
+    def get_end_orientation(self):
+        return int(self.orientation[-1]) if len(self.orientation)>0 else -1
+
+
 class RobotTask:
     log_tasks = ["park", "dummy", "goto_buffer_lane", "goto_buffer_store", "goto_parking", "goto",
                  "pickup_lane", "pickup_store", "unload", "wait", "begin_task", "end_task", "find_destination"]
-    lastID    = 0
-    def __init__(self, wait=-1., floor_plan=None, goto_pos=None, load_lane=None, load_store=None, unload=None, begin=None, find_destination=False):
+    def __init__(self, context, wait=-1., floor_plan=None, goto_pos=None, load_lane=None, load_store=None, unload=None, begin=None, find_destination=False):
 
         # Set default values
-        self.ID           = RobotTask.lastID
-        RobotTask.lastID += 1
+        self.ID           = context.get_next_id("RobotTask")
         self.task_type    = "dummy"
         self.finished     = True
-        self.path         = []
+        self.path         = None
         self.goto         = (0.,0.)
-        self.segment      = 0
-        self.offset       = 0.
+        self.t_start      = 0.    # time of the first step along path
+        self.n_move       = 0     # number of steps to the end of path
         self.wait         = 0.
         self.store        = None
 
         if not floor_plan is None:
             if not goto_pos is None:
                 self.goto    = goto_pos.get_coords()
-                self.segment = 0
-                self.offset  = 0.
                 if goto_pos.pos_type=="buffer_lane":
                     self.task_type = "goto_buffer_lane"
                 elif goto_pos.pos_type=="buffer_store":
@@ -85,9 +132,8 @@ class RobotTask:
         text  = f"ID = {self.ID:d} \n"
         text += f"task = {self.task_type:s} \n"
         text += f"finished = {str(self.finished):s} \n"
-        text += f"segment = {self.segment:d}\n"
-        text += f"offset = {self.offset:f}\n"
-        if len(self.path)>0: text+=f"p0={str(self.path[0]):s}\n"
+        text += f"t_start = {self.t_start:f}\n"
+        if not self.path is None: text+=f"p0={str(self.path.vertices[0]):s}\n"
         text += f"goto = {str(self.goto):s}\n"
         text += f"wait = {self.wait:f}\n"
         return text
@@ -97,43 +143,23 @@ class RobotTask:
 
     def time_step(self, robot, floor_plan):
         if self.task_type[0:4]=="goto":
-            if len(self.path)==0:
-                self.path = floor_plan.grid_graph.get_shortest_path((robot.w,robot.h), self.goto)
+            # The robot position is only updated at the end of the path (or by update_position())
+            if self.path is None:
+                path = floor_plan.get_path((robot.w,robot.h), self.goto)
 
-                if len(self.path)==0:
+                if len(path)==0:
                     print("ERROR: Robot.time_step(). Path not found.")
                     print(robot.ID, (robot.w,robot.h), (robot.w,robot.h) in floor_plan.grid_graph.v_neighbors)
                     print(self)
-
-            elif self.segment>=len(self.path)-1:
-                self.path     = []
+                    raise PathNotFoundError(f"path not found, robot = {robot.ID}, goto = {self.goto}")
+                self.path    = RobotPath(path)
+                self.t_start = floor_plan.time_sec
+                self.n_move  = max(1, math.ceil((self.path.length-EPS)/(TIME_STEP_S*M.ROBOT_SPEED)))
+
+            if self.__get_n_move_done(floor_plan.time_sec)+1>=self.n_move:
+                robot.set_orientation(self.path.get_end_orientation())
+                robot.set_coords(self.path.end)
                 self.finished = True
-                return
-
-            step_todo = TIME_STEP_S * M.ROBOT_SPEED
-
-            p_begin   = robot.get_coords_offset(self.path[self.segment], self.offset)
-            for p_end in self.path[self.segment + 1:]:
-                d = get_distance_city_block(p_begin, p_end)
-                if d>0.:
-                    robot.o = get_orientation(p_begin, p_end)
-                    robot._update_rot_mat()
-
-                if step_todo<d:  # step before segment end point
-                    self.offset += step_todo
-                    robot.set_coords(robot.get_coords_offset(self.path[self.segment], self.offset))
-                    return
-
-                else:  # step beyond segment end point
-                    self.offset   = 0.
-                    step_todo    -= d
-                    p_begin       = p_end
-                    self.segment += 1
-
-            self.segment = len(self.path)  # use this to test whether robot is at end of path
-            self.offset  = 0.
-            robot.set_coords(self.path[-1])
-            self.finished = True
 
         elif self.task_type=="pickup_lane" or self.task_type=="pickup_store":
             if self.wait<=0:
@@ -160,6 +186,53 @@ class RobotTask:
                 robot._complete_process_incoming(floor_plan)
                 self.finished = True
 
+    def __get_n_move_done(self, time_sec):
+        return int(round((time_sec-self.t_start)/TIME_STEP_S))
+
+    def update_position(self, robot, time_sec):
+        # Position along the path, after the time step that ended at time_sec
+        if self.task_type[0:4]!="goto" or self.path is None or self.finished: return
+
+        arc = min(self.__get_n_move_done(time_sec), self.n_move) * TIME_STEP_S*M.ROBOT_SPEED
+        if arc+EPS>=self.path.length:
+            coords, o = self.path.end, self.path.get_end_orientation()
+        else:
+            coords, o = self.path.get_position(arc)
+        robot.set_orientation(o)
+        robot.set_coords(coords)
+
+    def get_n_idle_steps(self, robot, floor_plan):
+        """
+            return number of time steps the task can be executed without finishing or changing its surroundings
+        """
+        if self.task_type[0:4]=="goto":
+            if self.path is None: return 0
+            return max(0, self.n_move-self.__get_n_move_done(floor_plan.time_sec)-1)
+
+        if self.task_type in ["pickup_lane", "pickup_store", "unload", "wait"]:
+            return max(0, int(self.wait/TIME_STEP_S))
+
+        return 0
+
+    def skip_steps(self, robot, n_step):
+        # Equivalent to n_step calls of time_step(), provided that get_n_idle_steps()>=n_step
+        # (goto tasks follow from the time)
+        if self.task_type in ["pickup_lane", "pickup_store", "unload", "wait"]:
+            self.wait -= n_step * TIME_STEP_S
+
+    def get_expected_time(self, floor_plan, coords):
+        # Expected time to finish the task, when it starts (or goes on) at coords
+        if self.finished:
+            return 0.
+        if self.task_type[0:4]=="goto":
+            if self.path is None: return floor_plan.get_path_length(coords, self.goto)/M.ROBOT_SPEED
+            return max(0, self.n_move-self.__get_n_move_done(floor_plan.time_sec)) * TIME_STEP_S
+        if self.task_type in ["pickup_lane", "pickup_store", "unload", "wait"]:
+            return max(0., self.wait)
+        if self.task_type=="find_destination":
+            return M.ROBOT_UNLOAD_TIME  # the store is not known yet: only count the unloading
+        return 0.
+
     def get_time_to_finish(self):
         if self.finished:
             return 0.
@@ -169,66 +242,145 @@ class RobotTask:
             return self.wait
         return TIME_STEP_S
 
-from functools import update_wrapper, partial
 class RobotLogger:
-    def __init__(self, func):
-        update_wrapper(self, func)
-        self.func = func
-
-        self.time      = 0.
-        self.samp      = 0
-        self.task_dict = Counter()            # current number of tasks of each robot
-        self.rob_dict  = defaultdict(Counter) # number of times each task type is executed, for each robot
-        self.log_file  = ""
-
-    def __get__(self, obj, objtype):
-        return partial(self.__call__, obj)
-
-    def __call__(self, rob, *args, **kwargs):
-        if not M.ROBOT_LOGGING:
-            return self.func(rob, *args, **kwargs)
-
+    """
+        Time spent on each task type by each robot and their mean task list lengths, written to the log file every
+        LOG_INTERVAL_ROBOT seconds. The robots are logged together, from the task type codes (index in
+        RobotTask.log_tasks) and task list lengths kept by RobotFleet.
+    """
+    def __init__(self, robots, context):
+        self.context    = context  # SimulationContext, for the log file name
+        self.time       = 0.
+        self.samp       = 0
+        self.n_logged   = 0
+        self.ids        = [rob.ID for rob in robots]
+        self.n_task_sum = np.zeros(len(robots), int)                            # task list lengths summed since the last log
+        self.counts     = np.zeros((len(robots), len(RobotTask.log_tasks)), int) # number of steps of each task type
+        self.log_file   = ""
+
+    def log(self, task_codes, n_tasks, n_step):
+        # Log n_step time steps of all robots, in which none of them changes its task list
+        n_log = int(0.5+LOG_INTERVAL_ROBOT/TIME_STEP_S)
+        while n_step>0:
+            n = min(n_step, n_log-self.samp)
+            self.__log(task_codes, n_tasks, n)
+            n_step -= n
+
+    def __log(self, task_codes, n_tasks, n_step):
         # Write log file header
         if self.log_file=="":
-            self.log_file = get_log_filename("Robots")
+            self.log_file = self.context.get_log_filename("Robots")
             with open(self.log_file, "w") as fp:
                 fp.write("ID\ttime\t" + '\t'.join(RobotTask.log_tasks) + "\tn_tasks\n")
 
         # Add current status to log file
-        if rob.ID==0:
-            if self.samp==0:
-                with open(self.log_file, "a") as fp:
-                    for id in sorted(self.rob_dict):
-                        times = [self.rob_dict[id][ta] * TIME_STEP_S/3600. for ta in RobotTask.log_tasks]
-                        n_log = int(0.5+LOG_INTERVAL_ROBOT/TIME_STEP_S)
-                        if id>=0:
-                            n_tasks = self.task_dict[id]/n_log
-                            line    = f"{str(id) :s}\t{self.time/3600.:9.3f}\t" + '\t'.join(f"{t:8.1f}" for t in times) + '\t'+f"{n_tasks:8.1f}"+'\n'
-                        else:
-                            n_rob   = len(args[0].robots)
-                            times   = [t/n_rob for t in times]  # Compute mean time
-                            n_tasks = sum(v for v in self.task_dict.values())/(n_rob*n_log)
-                            line    = f"total\t{self.time/3600.:9.3f}\t" + '\t'.join(f"{t:8.1f}" for t in times) + '\t'+f"{n_tasks:8.1f}"+'\n'
-                        fp.write(line)
-                self.task_dict = Counter()
-
-            # Timings
-            self.time += TIME_STEP_S
-            self.samp += 1
-            if self.samp*TIME_STEP_S >= LOG_INTERVAL_ROBOT:
-                self.samp = 0
+        if self.samp==0 and self.n_logged>0:
+            self.__write()
+            self.n_task_sum[:] = 0
+
+        # Timings
+        self.time     += n_step*TIME_STEP_S
+        self.samp     += n_step
+        self.n_logged += n_step
+        if self.samp*TIME_STEP_S >= LOG_INTERVAL_ROBOT:
+            self.samp = 0
 
         # Keep track of stats
-        self.task_dict[rob.ID] += len(rob.task_list)
-        task = "park" if len(rob.task_list)==0 else rob.task_list[0].task_type
-        self.rob_dict[rob.ID][task] += 1
-        self.rob_dict[-1    ][task] += 1
+        self.n_task_sum += n_step*n_tasks
+        self.counts[np.arange(len(self.ids)), task_codes] += n_step
+
+    def __write(self):
+        n_log = int(0.5+LOG_INTERVAL_ROBOT/TIME_STEP_S)
+        n_rob = len(self.ids)
+        with open(self.log_file, "a") as fp:
+            times   = [c * TIME_STEP_S/3600. for c in self.counts.sum(axis=0).tolist()]
+            times   = [t/n_rob for t in times]  # Compute mean time
+            n_tasks = int(self.n_task_sum.sum())/(n_rob*n_log)
+            fp.write(f"total\t{self.time/3600.:9.3f}\t" + '\t'.join(f"{t:8.1f}" for t in times) + '\t'+f"{n_tasks:8.1f}"+'\n')
+
+            for r in np.argsort(self.ids).tolist():
+                times   = [c * TIME_STEP_S/3600. for c in self.counts[r].tolist()]
+                n_tasks = int(self.n_task_sum[r])/n_log
+                fp.write(f"{str(self.ids[r]) :s}\t{self.time/3600.:9.3f}\t" + '\t'.join(f"{t:8.1f}" for t in times) + '\t'+f"{n_tasks:8.1f}"+'\n')
+
+class RobotFleet:
+    """
+        Time stepping of all robots together. Robots only change their state at the end of a task (moving robots
+        follow their path in time, waiting robots count down), so each robot is only stepped in Python at the
+        time step where its current task can end, its wake up step. In between, its steps are skipped
+        (Robot.skip_steps()) just before it is stepped again.
+        Per robot r (in the order of floor_plan.robots):
+        n_wake[r]    : time step at which the robot has to be stepped (inf if it has no tasks)
+        n_synced[r]  : time step up to which (excluding) the robot state is updated
+        task_code[r] : current task, as index in RobotTask.log_tasks
+        n_tasks[r]   : current task list length
+        A robot whose task list is changed from outside (Robot._wake_up()) is stepped at the next time step.
+    """
+    def __init__(self, robots, context):
+        self.robots    = robots
+        self.n_step    = 0  # time steps since the start of the simulation
+        self.n_wake    = np.full(len(robots), np.inf)
+        self.n_synced  = np.zeros(len(robots), int)
+        self.task_code = np.zeros(len(robots), int)
+        self.n_tasks   = np.zeros(len(robots), int)
+        self.changed   = set(range(len(robots)))  # robots to be updated before the next step
+        self.logger    = RobotLogger(robots, context)
+        for r, rob in enumerate(robots):
+            rob.fleet, rob.fleet_index = self, r
+
+    def wake_up(self, r):
+        self.changed.add(r)
+        self.n_wake[r] = self.n_step
+
+    def __sync(self, r, n_step):
+        # Bring robot r up to date with the start of time step n_step
+        n_skip = n_step - self.n_synced[r]
+        if n_skip>0:
+            self.robots[r].skip_steps(n_skip)
+        self.n_synced[r] = n_step
+
+    def __update(self, floor_plan):
+        # Wake up steps and log data of the robots that were stepped or changed since the previous step
+        for r in self.changed:
+            rob = self.robots[r]
+            self.__sync(r, self.n_step)
+            self.n_wake[r]    = self.n_step + rob.get_n_idle_steps(floor_plan)
+            self.n_tasks[r]   = len(rob.task_list)
+            self.task_code[r] = 0 if len(rob.task_list)==0 else RobotTask.log_tasks.index(rob.task_list[0].task_type)
+        self.changed = set()
 
-        return self.func(rob, *args, **kwargs)
+    def time_step(self, floor_plan):
+        self.__update(floor_plan)
+        if M.ROBOT_LOGGING:
+            self.logger.log(self.task_code, self.n_tasks, 1)
+
+        for r in np.flatnonzero(self.n_wake<=self.n_step).tolist():
+            self.__sync(r, self.n_step)
+            self.robots[r].time_step(floor_plan)
+            self.n_synced[r] = self.n_step+1
+            self.changed.add(r)
+        self.n_step += 1
+
+    def sync(self, r):
+        # Bring robot r up to date with the current time step, e.g. to read the remaining time of its task
+        self.__sync(r, self.n_step)
+
+    def get_n_idle_steps(self, floor_plan):
+        self.__update(floor_plan)
+        if len(self.robots)==0: return math.inf
+
+        n_step = self.n_wake.min() - self.n_step
+        return math.inf if n_step==math.inf else max(0, int(n_step))
+
+    def skip_steps(self, floor_plan, n_step):
+        # Equivalent to n_step calls of time_step(), provided that get_n_idle_steps()>=n_step
+        self.__update(floor_plan)
+        if M.ROBOT_LOGGING:
+            self.logger.log(self.task_code, self.n_tasks, n_step)
+        self.n_step += n_step
 
 class Robot:
-    lastID = 0
-    def __init__(self, w, h, parking_pos, color=None):
+    def __init__(self, w, h, parking_pos, context, color=None):
         self.w           = w
         self.h           = h
         self.o           = 3
@@ -236,8 +388,10 @@ class Robot:
         self.col         = (200, 0, 0) if color is None else color
         self.rol         = None
         self.default_pos = parking_pos
-        self.ID          = Robot.lastID
-        Robot.lastID    += 1
+        self.context     = context
+        self.ID          = context.get_next_id("Robot")
+        self.fleet       = None  # RobotFleet that steps the robot
+        self.fleet_index = -1
         self._update_rot_mat()
 
         self.task_list = []
@@ -259,11 +413,15 @@ class Robot:
             self.rol.w, self.rol.h = pos
             self.rol.o = self.o
 
+    def set_orientation(self, o):
+        if o>=0 and o!=self.o:
+            self.o = o
+            self._update_rot_mat()
+
     def get_coords_offset(self, coords, s):
         if self.o==0 or self.o==2:    return coords[0] + (s if self.o==0 else -s), coords[1]
         if self.o==1 or self.o==3:    return coords[0], coords[1] + (s if self.o==1 else -s)
 
-    @RobotLogger
     def time_step(self, floor_plan):
         if len(self.task_list)<=0: return
 
@@ -277,12 +435,29 @@ class Robot:
         if task.finished:
             self.task_list.pop(0)
 
+    def get_n_idle_steps(self, floor_plan):
+        if len(self.task_list)<=0: return math.inf
+
+        task = self.task_list[0]
+        if task.finished or task._is_dummy_task(): return 0
+        return task.get_n_idle_steps(self, floor_plan)
+
+    def update_position(self, floor_plan):
+        # Robot positions are not updated while moving along a path: compute it for drawing or path planning
+        if len(self.task_list)>0:
+            self.task_list[0].update_position(self, floor_plan.time_sec)
+
+    def skip_steps(self, n_step):
+        # Equivalent to n_step calls of time_step(), provided that get_n_idle_steps()>=n_step
+        if len(self.task_list)<=0: return
+        self.task_list[0].skip_steps(self, n_step)
+
     def get_time_to_pos(self, floor_plan, pos):
+        self.update_position(floor_plan)
         coords1  = (self.w, self.h)
         coords2  = pos.get_coords()
-        path     = floor_plan.grid_graph.get_shortest_path(coords1, coords2, get_distance_city_block)
 
-        return get_path_len(path)/M.ROBOT_SPEED
+        return floor_plan.get_path_length(coords1, coords2)/M.ROBOT_SPEED
 
     def get_task_list_length(self):
         return len(self.task_list)
@@ -293,6 +468,24 @@ class Robot:
             time_to_finish += task.get_time_to_finish()
         return time_to_finish
 
+    def get_expected_end(self, floor_plan, first_job=False):
+        """
+            return expected time until the robot has finished its jobs (without its return to parking) and its
+            coordinates then. With first_job only up to the end of its current job, where insert_process_store() inserts
+            a new job.
+        """
+        if self.fleet is not None:
+            self.fleet.sync(self.fleet_index)
+        self.update_position(floor_plan)
+        coords = (self.w, self.h)
+        time   = 0.
+        for task in self.task_list:
+            if task.task_type=="goto_parking": break
+            time += task.get_expected_time(floor_plan, coords)
+            if task.task_type[0:4]=="goto": coords = task.goto
+            if first_job and task.task_type in ["end_task", "find_destination"]: break
+        return time, coords
+
     def get_time_to_start_parking(self):
         time_to_finish = 0.
         for task in self.task_list:
@@ -301,9 +494,14 @@ class Robot:
             time_to_finish += task.get_time_to_finish()
         return time_to_finish
 
+    def _wake_up(self):
+        # The task list is changed: the robot has to be stepped at the next time step
+        if self.fleet is not None:
+            self.fleet.wake_up(self.fleet_index)
+
     def _append_parking(self, floor_plan):
         if self.task_list[-2].task_type!="goto_parking":
-            self.task_list += [RobotTask(begin=True), RobotTask(floor_plan=floor_plan, goto_pos=self.default_pos), RobotTask(begin=False)]
+            self.task_list += [RobotTask(self.context, begin=True), RobotTask(self.context, floor_plan=floor_plan, goto_pos=self.default_pos), RobotTask(self.context, begin=False)]
 
     def wait_process_incoming(self, floor_plan, wait, pos_pickup):
         if not self.rol is None:
@@ -315,18 +513,19 @@ class Robot:
             return
 
         # new, incomplete task (storage destination not yet known)
-        self.task_list = [RobotTask(begin=True),
-                          RobotTask(wait=wait),
-                          RobotTask(floor_plan=floor_plan, goto_pos=pos_pickup),
-                          RobotTask(wait=M.ROBOT_LOAD_TIME, load_lane=pos_pickup.get_store_object(floor_plan)),
-                          RobotTask(find_destination=True)]
+        self.task_list = [RobotTask(self.context, begin=True),
+                          RobotTask(self.context, wait=wait),
+                          RobotTask(self.context, floor_plan=floor_plan, goto_pos=pos_pickup),
+                          RobotTask(self.context, wait=M.ROBOT_LOAD_TIME, load_lane=pos_pickup.get_store_object(floor_plan)),
+                          RobotTask(self.context, find_destination=True)]
+        self._wake_up()
 
     def append_process_incoming(self, floor_plan, pos_pickup, prepend=False):
         # new, incomplete task (storage destination not yet known)
-        new_tasks = [RobotTask(begin=True),
-                     RobotTask(floor_plan=floor_plan, goto_pos=pos_pickup),
-                     RobotTask(wait=M.ROBOT_LOAD_TIME, load_lane=pos_pickup.get_store_object(floor_plan)),
-                     RobotTask(find_destination=True)]
+        new_tasks = [RobotTask(self.context, begin=True),
+                     RobotTask(self.context, floor_plan=floor_plan, goto_pos=pos_pickup),
+                     RobotTask(self.context, wait=M.ROBOT_LOAD_TIME, load_lane=pos_pickup.get_store_object(floor_plan)),
+                     RobotTask(self.context, find_destination=True)]
 
         n_tasks = len(self.task_list)
         if n_tasks==0:
@@ -358,14 +557,15 @@ class Robot:
             self.task_list = self.task_list[:end_list]  + new_tasks + self.task_list[end_list:]
 
         self._append_parking(floor_plan)
+        self._wake_up()
 
     def _complete_process_incoming(self, floor_plan):
         if self.rol is None:
             print(self)
-        pos_store = BSM.choose_and_reserve_store(floor_plan, self.rol)
-        task_list = [RobotTask(floor_plan=floor_plan, goto_pos=pos_store),
-                     RobotTask(wait=M.ROBOT_UNLOAD_TIME, unload=pos_store.get_store_object(floor_plan)),
-                     RobotTask(begin=False)]
+        pos_store = self.context.bsm.choose_and_reserve_store(floor_plan, self.rol)
+        task_list = [RobotTask(self.context, floor_plan=floor_plan, goto_pos=pos_store),
+                     RobotTask(self.context, wait=M.ROBOT_UNLOAD_TIME, unload=pos_store.get_store_object(floor_plan)),
+                     RobotTask(self.context, begin=False)]
 
         # insert new tasks
         self.task_list = self.task_list[:1] + task_list + self.task_list[1:]
@@ -373,12 +573,12 @@ class Robot:
 
     def insert_process_store(self, floor_plan, pos_pickup, pos_unload):
 
-        new_tasks = [RobotTask(begin=True),
-                     RobotTask(floor_plan=floor_plan, goto_pos=pos_pickup),
-                     RobotTask(wait=M.ROBOT_LOAD_TIME, load_store=pos_pickup.get_store_object(floor_plan)),
-                     RobotTask(floor_plan=floor_plan, goto_pos=pos_unload),
-                     RobotTask(wait=M.ROBOT_UNLOAD_TIME, unload=pos_unload.get_store_object(floor_plan)),
-                     RobotTask(begin=False)]
+        new_tasks = [RobotTask(self.context, begin=True),
+                     RobotTask(self.context, floor_plan=floor_plan, goto_pos=pos_pickup),
+                     RobotTask(self.context, wait=M.ROBOT_LOAD_TIME, load_store=pos_pickup.get_store_object(floor_plan)),
+                     RobotTask(self.context, floor_plan=floor_plan, goto_pos=pos_unload),
+                     RobotTask(self.context, wait=M.ROBOT_UNLOAD_TIME, unload=pos_unload.get_store_object(floor_plan)),
+                     RobotTask(self.context, begin=False)]
 
         if len(self.task_list)==0:
             self.task_list = new_tasks
@@ -394,6 +594,7 @@ class Robot:
             self.task_list = self.task_list[:end_list] + new_tasks + self.task_list[end_list:]
 
         self._append_parking(floor_plan)
+        self._wake_up()
 
     def is_idle(self):
         return len(self.task_list)==0
@@ -419,6 +620,7 @@ class Robot:
         return xa+self.w, ya+self.h
 
     def draw(self, floor_plan):
+        import cv2 as cv
         # Engine
         w1  = self.w - 0.5*(W1_ROBOT+W2_ROBOT)
         w2  = w1 + W1_ROBOT
@@ -1,9 +1,7 @@
-import cv2 as cv
 from XdockParams import W_ROLL_CONTAINER, H_ROLL_CONTAINER, BLACK
 
 class RollContainer:
-    lastID = 0
-    def __init__(self, w, h, orientation, destination, prio, color):
+    def __init__(self, w, h, orientation, destination, prio, color, context):
         self.w         = w
         self.h         = h
         self.o         = orientation
@@ -11,8 +9,7 @@ class RollContainer:
         self.col       = color
         self.prio      = prio
         self.scheduled = False
-        self.ID        = RollContainer.lastID
-        RollContainer.lastID += 1
+        self.ID        = context.get_next_id("RollContainer")
 
     def __str__(self):
         text  = f"ID = {self.ID:d}\n"
@@ -24,6 +21,7 @@ class RollContainer:
         return text
 
     def draw(self, floor_plan):
+        import cv2 as cv
         w1 = self.w - 0.5*W_ROLL_CONTAINER
         w2 = w1 + W_ROLL_CONTAINER
         h1 = self.h - 0.5*H_ROLL_CONTAINER
@@ -0,0 +1,323 @@
+import argparse
+from collections import namedtuple
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from FloorPlan import FloorPlan
+from Position import Position
+
+from XdockParams import TIME_STEP_S
+from SimulationConfig import set_dock_names_colors, get_output_dock
+from TruckPlan import TruckPlan
+from SimulationContext import SimulationContext
+from BufferStoreManager import BufferOverflowError
+from Robot import PathNotFoundError
+
+from ModelParameters import ModelParams as M
+
+# Criteria to stop a run early (None or False: not used). Picklable, for the workers of a parameter sweep
+# max_nrc_not_unloaded: roll containers left on inbound trucks that departed
+# max_backlog         : roll containers waiting on docked inbound trucks and in the incoming lanes
+# buffer_overflow     : no buffer store left for a destination (the run cannot go on)
+# A robot that cannot find its path stops any run with abort criteria
+AbortCriteria = namedtuple("AbortCriteria", "max_nrc_not_unloaded max_backlog buffer_overflow", defaults=(None, None, False))
+
+ABORT_CHECK_INTERVAL_S = 60.  # simulated time between two checks of the abort criteria
+
+# New job for a robot, for the assignment dispatcher: roll container from pos_pickup to a buffer store (pos_unload None,
+# incoming roll container ready for pickup t_ready seconds from now) or to pos_unload (outbound)
+RobotJob = namedtuple("robot_job", "pos_pickup pos_unload t_ready prepend")
+
+
+class Simulation:
+    """
+        Dispatching and time stepping of a cross dock for one truck plan, without any drawing.
+    """
+    def __init__(self, simulate=False, x_dock_name="C_TL", headless=True, event_driven=False, fast_forward=False, context=None,
+                 abort_criteria=None, seed=None, arrival_jitter=0.):
+        self.context        = SimulationContext() if context is None else context
+        self.context.activate()
+        self.event_driven   = event_driven
+        self.fast_forward   = fast_forward
+        self.abort_criteria = abort_criteria
+        self.abort_reason   = ""     # why the run was stopped early
+        self.partial_step   = False  # the run was stopped within a time step, of which the state is partly updated
+        self.floor_plan = FloorPlan(headless=headless, context=self.context)
+        set_dock_names_colors(self.floor_plan)
+
+        self.truck_plan = TruckPlan(simulate, x_dock_name, self.context, seed, arrival_jitter)
+        self.samp_start = int(self.truck_plan.start_time/TIME_STEP_S)
+        self.samp_end   = int(self.truck_plan.end_time  /TIME_STEP_S)
+        self.sample     = self.samp_start
+        self.samp_check = self.samp_start + int(ABORT_CHECK_INTERVAL_S/TIME_STEP_S)
+
+        self.floor_plan.time_sec = self.samp_start*TIME_STEP_S
+        self.floor_plan.set_truck_list([t for t in self.truck_plan.truck_list])
+
+    def dispatch(self):
+        if M.DISPATCHER=="assignment":
+            self.dispatch_assignment()
+            return
+
+        fp  = self.floor_plan
+        bsm = self.context.bsm
+        for dock in range(M.N_DOCK):
+            rc_incoming = fp.get_incoming_roll_containers(dock)
+            truck       = fp.docks[dock].truck
+
+            # Process incoming trolleys
+            if len(rc_incoming)>0:
+                priority = 0 if truck is None or not truck.inbound else fp.get_nrc_incoming(dock)
+
+                # assign robots to incoming roll containers, until all roll containers are assigned to robot
+                rob_list = bsm.get_sorted_robots(fp.robots, dock, len(rc_incoming))
+
+                for n, (robot, roll_io) in enumerate(zip(rob_list, rc_incoming), start=1):
+                    pos_pickup = Position(fp, dock, buffer_lane=roll_io.lane)
+
+                    if robot.is_idle():
+                        wait  = max(0., roll_io.eta + n*1.5*M.TIME_LOAD_BUFFER_LANE - robot.get_time_to_pos(fp, pos_pickup) )
+                        robot.wait_process_incoming(fp, wait, pos_pickup)
+                    else:
+                        robot.append_process_incoming(fp, pos_pickup, priority>3)
+
+                    roll_io.roll_container.scheduled = True
+
+            if truck is None: continue
+
+            # Process outbound trucks
+            if not truck.inbound:
+                # Get all buffers with required destination, but skip stores that are unused.
+                buffer_list = bsm.get_buffer_list(truck.destination, truck.prios[0])
+                buffer_list = [(d,b) for (d,b) in buffer_list if not fp.buffer_stores[d,b].is_store_unused()]
+                dock_dest   = get_output_dock(truck.destination, truck.prios[0])
+                rob_list    = bsm.get_sorted_robots(fp.robots, dock_dest)
+                r           = 0
+                for (dock_orig,store) in buffer_list: # plan robots from buffer store to output lane
+                    row     = fp.buffer_stores[dock_orig, store].get_row_not_scheduled()
+                    lane    = fp.get_best_available_lane(dock_dest, output=True)
+
+                    while lane>=0 and row>=0:
+                        fp.buffer_stores[dock_orig, store].schedule_roll_container(row)
+                        fp.buffer_lanes[dock_dest, lane].reserve_store()
+
+                        pos_pickup = Position(fp, dock_orig, buffer_store=store, row=row, col=0)
+                        pos_unload = Position(fp, dock_dest, buffer_lane=lane)
+                        rob = rob_list[r]
+                        rob.insert_process_store(fp, pos_pickup, pos_unload)
+
+                        r    = (r+1)%len(rob_list)
+                        row  = fp.buffer_stores[dock_orig, store].get_row_not_scheduled()
+                        lane = fp.get_best_available_lane(dock_dest, output=True)
+
+    def get_new_jobs(self):
+        """
+            return the new jobs of this time step, for all docks, as RobotJobs. The roll containers and the places they
+            go to are scheduled and reserved as in dispatch(), but no robot is chosen yet.
+        """
+        fp   = self.floor_plan
+        bsm  = self.context.bsm
+        jobs = []
+        for dock in range(M.N_DOCK):
+            rc_incoming = fp.get_incoming_roll_containers(dock)[:len(fp.robots)]
+            truck       = fp.docks[dock].truck
+
+            # Incoming roll containers
+            if len(rc_incoming)>0:
+                priority = 0 if truck is None or not truck.inbound else fp.get_nrc_incoming(dock)
+                for n, roll_io in enumerate(rc_incoming, start=1):
+                    pos_pickup = Position(fp, dock, buffer_lane=roll_io.lane)
+                    jobs.append(RobotJob(pos_pickup, None, roll_io.eta + n*1.5*M.TIME_LOAD_BUFFER_LANE, priority>3))
+                    roll_io.roll_container.scheduled = True
+
+            if truck is None or truck.inbound: continue
+
+            # Outbound trucks: from buffer stores to output lanes
+            buffer_list = [(d,b) for (d,b) in bsm.get_buffer_list(truck.destination, truck.prios[0]) if not fp.buffer_stores[d,b].is_store_unused()]
+            dock_dest   = get_output_dock(truck.destination, truck.prios[0])
+            for (dock_orig, store) in buffer_list:
+                row  = fp.buffer_stores[dock_orig, store].get_row_not_scheduled()
+                lane = fp.get_best_available_lane(dock_dest, output=True)
+                while lane>=0 and row>=0:
+                    fp.buffer_stores[dock_orig, store].schedule_roll_container(row)
+                    fp.buffer_lanes[dock_dest, lane].reserve_store()
+                    jobs.append(RobotJob(Position(fp, dock_orig, buffer_store=store, row=row, col=0),
+                                         Position(fp, dock_dest, buffer_lane=lane), 0., False))
+
+                    row  = fp.buffer_stores[dock_orig, store].get_row_not_scheduled()
+                    lane = fp.get_best_available_lane(dock_dest, output=True)
+        return jobs
+
+    def dispatch_assignment(self):
+        """
+            Assign all new jobs of this time step at once: each robot gets at most one job per round, such that the
+            sum over the jobs of the time at which the job can start is minimal. That is the time until the robot gets
+            to the job in its task list (Robot.get_expected_end(): after all its jobs, or after its current job for
+            outbound jobs, where insert_process_store() puts them) plus its travel time to the pickup position from
+            there, or the time at which the roll container is ready for pickup, if later. Prepended incoming jobs are
+            costed after all jobs of the robot: they start after the store delivery that find_destination inserts in
+            front of them, and that store is not known yet. Jobs that are left (more jobs than robots) go to the next
+            round.
+        """
+        fp   = self.floor_plan
+        jobs = self.get_new_jobs()
+        if len(jobs)==0: return
+
+        robots = fp.robots
+        ends   = [(robot.get_expected_end(fp), robot.get_expected_end(fp, first_job=True)) for robot in robots]
+        while len(jobs)>0:
+            first   = [job.pos_unload is not None for job in jobs]                 # inserted after the current job
+            pickups = [job.pos_pickup.get_coords() for job in jobs]
+            starts  = [[end[f] for f in first] for end in ends]                   # (t_end, coords) per robot and job
+            travel  = np.array([[fp.get_path_length(coords, pickup)/M.ROBOT_SPEED for ((t_end, coords), pickup) in zip(row, pickups)] for row in starts])
+            t_end   = np.array([[t_end for (t_end, coords) in row] for row in starts])
+            t_ready = np.array([job.t_ready for job in jobs])
+            cost    = np.maximum(t_end + travel, t_ready[None, :])
+            rob_idx, job_idx = linear_sum_assignment(cost)
+
+            for r, j in zip(rob_idx.tolist(), job_idx.tolist()):
+                robot, job = robots[r], jobs[j]
+                if job.pos_unload is not None:
+                    robot.insert_process_store(fp, job.pos_pickup, job.pos_unload)
+                elif robot.is_idle():
+                    wait = max(0., job.t_ready - robot.get_time_to_pos(fp, job.pos_pickup))
+                    robot.wait_process_incoming(fp, wait, job.pos_pickup)
+                else:
+                    robot.append_process_incoming(fp, job.pos_pickup, job.prepend)
+                ends[r] = (robot.get_expected_end(fp), robot.get_expected_end(fp, first_job=True))
+
+            assigned = set(job_idx.tolist())
+            jobs     = [job for (j, job) in enumerate(jobs) if j not in assigned]
+
+    def has_pending_jobs(self):
+        # Would dispatch() assign any new job to a robot?
+        fp = self.floor_plan
+        for dock in range(M.N_DOCK):
+            if len(fp.get_incoming_roll_containers(dock))>0:
+                return True
+
+            truck = fp.docks[dock].truck
+            if truck is None or truck.inbound: continue
+
+            if fp.get_best_available_lane(get_output_dock(truck.destination, truck.prios[0]), output=True)<0: continue
+            for (dock_orig, store) in self.context.bsm.get_buffer_list(truck.destination, truck.prios[0]):
+                buffer_store = fp.buffer_stores[dock_orig, store]
+                if not buffer_store.is_store_unused() and buffer_store.get_row_not_scheduled()>=0:
+                    return True
+
+        return False
+
+    def get_backlog(self):
+        # number of roll containers that still have to get from inbound trucks into buffer stores
+        fp = self.floor_plan
+        n  = sum(fp.get_nrc_incoming(dock) for dock in range(M.N_DOCK))
+        n += sum(len(fp.docks[dock].truck.truck_load) for dock in range(M.N_DOCK) if fp.docks[dock].truck and fp.docks[dock].truck.inbound)
+        return n
+
+    def check_abort_criteria(self):
+        # return reason to stop the run, or "" to go on
+        crit = self.abort_criteria
+        if crit.max_nrc_not_unloaded is not None:
+            nrc = sum(len(t.truck_load) for t in self.floor_plan.get_incompletely_unloaded_trucks())
+            if nrc>crit.max_nrc_not_unloaded:
+                return f"{nrc:d} roll containers not unloaded"
+        if crit.max_backlog is not None:
+            nrc = self.get_backlog()
+            if nrc>crit.max_backlog:
+                return f"backlog of {nrc:d} roll containers"
+        return ""
+
+    def stop_in_step(self, reason):
+        # Stop the run at the start time of the current step, which was not completed
+        self.abort_reason = reason
+        self.partial_step = True
+
+    def step(self):
+        self.context.activate()
+        try:
+            self.dispatch()
+            self.floor_plan.time_step()
+        except BufferOverflowError as error:
+            if self.abort_criteria is None or not self.abort_criteria.buffer_overflow: raise
+            self.stop_in_step(str(error))
+            return
+        except PathNotFoundError as error:
+            if self.abort_criteria is None: raise
+            self.stop_in_step(str(error))
+            return
+        self.sample += 1
+
+        if self.abort_criteria is not None and self.sample>=self.samp_check:
+            self.samp_check   = self.sample + int(ABORT_CHECK_INTERVAL_S/TIME_STEP_S)
+            self.abort_reason = self.abort_reason or self.check_abort_criteria()
+        if self.abort_reason:
+            return
+
+        # Jump to the time step before the next event or, if nothing happens at all, before the next truck arrival
+        n_step = 0
+        if self.event_driven:
+            n_step = self.floor_plan.get_n_idle_steps()
+        elif self.fast_forward:
+            n_step = self.floor_plan.get_n_steps_to_next_arrival()
+
+        n_step = min(n_step, self.samp_end-self.sample)
+        if n_step>0 and not self.has_pending_jobs():
+            self.floor_plan.skip_steps(n_step)
+            self.sample += n_step
+
+    def is_finished(self):
+        return self.sample>=self.samp_end or self.abort_reason!=""
+
+    def run(self):
+        self.context.activate()
+        while not self.is_finished():
+            self.step()
+        return self.floor_plan.get_results()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless cross dock simulation")
+    parser.add_argument("--simulate", action="store_true", help="use the simulated truck plan instead of the transport scheme")
+    parser.add_argument("--x-dock", default="C_TL", help="cross dock name in the transport scheme")
+    parser.add_argument("--data-dir", default=M.DATA_DIR, help="directory with input file and logging sub directory")
+    parser.add_argument("--data-file", default=M.DATA_FILE, help="transport scheme (excel)")
+    parser.add_argument("--n-robot", type=int, default=M.N_ROBOT)
+    parser.add_argument("--no-robot-logging", action="store_true")
+    parser.add_argument("--no-path-cache", action="store_true", help="always compute the grid graph and path tables")
+    parser.add_argument("--path-memmap", action="store_true", help="memory map the path tables from the cache (large floor plans)")
+    parser.add_argument("--path-hierarchical", action="store_true", help="path tables per dock module (many docks)")
+    parser.add_argument("--dispatcher", default=M.DISPATCHER, choices=["greedy", "assignment"], help="robot selection for new jobs")
+    parser.add_argument("--event-driven", action="store_true", help="skip time steps in which no event happens")
+    parser.add_argument("--fast-forward", action="store_true", help="skip to the next truck arrival when the floor plan is at rest")
+    parser.add_argument("--abort-not-unloaded", type=int, default=None, help="stop when more roll containers are left on departed inbound trucks")
+    parser.add_argument("--abort-backlog", type=int, default=None, help="stop when more roll containers wait on inbound trucks and incoming lanes")
+    parser.add_argument("--abort-overflow", action="store_true", help="stop at a buffer overflow")
+    args = parser.parse_args()
+
+    params = M()
+    params.set_data_dir(args.data_dir)
+    params.set_data_input_file(args.data_file)
+    params.set_n_robot(args.n_robot)
+    params.set_robot_logging(not args.no_robot_logging)
+    params.set_path_cache(not args.no_path_cache)
+    params.set_path_memmap(args.path_memmap)
+    params.set_path_hierarchical(args.path_hierarchical)
+    params.set_dispatcher(args.dispatcher)
+
+    criteria = AbortCriteria(args.abort_not_unloaded, args.abort_backlog, args.abort_overflow)
+    if criteria==AbortCriteria(): criteria = None
+
+    sim     = Simulation(args.simulate, args.x_dock, event_driven=args.event_driven, fast_forward=args.fast_forward,
+                         abort_criteria=criteria)
+    results = sim.run()
+    sim.floor_plan.log_results()
+    if sim.abort_reason:
+        print(f"stopped at t = {sim.floor_plan.time_sec/3600:.2f} h: {sim.abort_reason:s}")
+
+    for name, value in results._asdict().items():
+        print(f"{name:20s} = {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import threading
+
+from ModelParameters import ModelParams, get_log_filename
+from BufferStoreManager import BufferStoreManager
+
+
+class SimulationContext:
+    """
+        State of one simulation that is shared by its objects: a copy of the model parameters, the buffer store
+        manager, the ID counters and the names of the log files. Simulations with their own context can share a
+        process; the model parameters are made current with activate(), which Simulation.step() does, such that
+        simulations with different parameters can even be stepped alternately.
+        The model parameters are class attributes of ModelParams, shared by all threads: a context cannot be activated
+        while the context of another (living) thread is active, unless that thread has called release().
+        The log file names have the hash of the model parameters and, from the second context of the process on, a tag
+        with the number of the context, such that contexts with the same parameters do not write to the same files.
+    """
+    active        = None  # context of which the parameters are current
+    active_thread = None  # ident of the thread that activated it
+    n_context     = 0     # number of contexts created in this process
+
+    def __init__(self, params=None):
+        self.params = ModelParams().get_params() if params is None else dict(params)
+        self.activate()
+
+        self.bsm            = BufferStoreManager()
+        self.id_dict        = dict()  # class name -> next ID
+        self.log_tag        = "" if SimulationContext.n_context==0 else f"-{SimulationContext.n_context:d}"
+        self.truck_log_file = ""
+        SimulationContext.n_context += 1
+
+    def activate(self):
+        if SimulationContext.active is self: return
+
+        thread = threading.get_ident()
+        if SimulationContext.active is not None and SimulationContext.active_thread!=thread and \
+           any(t.ident==SimulationContext.active_thread for t in threading.enumerate()):
+            raise RuntimeError("SimulationContext.activate(). The context of another thread is active")
+        ModelParams().set_params(self.params)
+        SimulationContext.active        = self
+        SimulationContext.active_thread = thread
+
+    def release(self):
+        # Let contexts of other threads be activated (the model parameters stay as they are)
+        if SimulationContext.active is self:
+            SimulationContext.active        = None
+            SimulationContext.active_thread = None
+
+    def get_next_id(self, name):
+        ID                 = self.id_dict.get(name, 0)
+        self.id_dict[name] = ID + 1
+        return ID
+
+    def get_log_filename(self, base_name):
+        # name of a log file of this context, for its model parameters
+        self.activate()
+        return get_log_filename(base_name, self.log_tag)
+
+    def log_truck(self, truck):
+        if self.truck_log_file=="":
+            self.truck_log_file = self.get_log_filename("Trucks")
+            with open(self.truck_log_file, "w") as fp:
+                fp.write(truck._get_log_line(header=True) + '\n')
+
+        with open(self.truck_log_file, "a") as fp:
+            fp.write(truck._get_log_line() + '\n')
@@ -0,0 +1,39 @@
+import pickle
+
+from SimulationContext import SimulationContext
+
+from ModelParameters import ModelParams as M
+
+
+# Version of the snapshot format; increase it when the state of the simulation objects changes
+SNAPSHOT_VERSION = 7
+
+
+def save_snapshot(file_name, sim):
+    """
+        Write the state of simulation sim (Simulation) at its current time step to file_name.
+        The file has a header with the format version and the model parameters, followed by the pickled simulation.
+        The figure and the path tables of the floor plan are not saved; they follow from the model parameters and
+        are rebuilt (or read from the path cache) by load_snapshot().
+    """
+    with open(file_name, "wb") as fp:
+        pickle.dump((SNAPSHOT_VERSION, sim.context.params), fp, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(sim, fp, pickle.HIGHEST_PROTOCOL)
+
+def load_snapshot(file_name):
+    """
+        return the simulation saved by save_snapshot(), which continues from where it was saved. Its model parameters
+        are made current.
+    """
+    with open(file_name, "rb") as fp:
+        version, params = pickle.load(fp)
+        if version!=SNAPSHOT_VERSION:
+            raise ValueError(f"load_snapshot(). {file_name} has version {version}, expected {SNAPSHOT_VERSION}")
+
+        # The floor plan builds its path tables while it is loaded
+        M().set_params(params)
+        SimulationContext.active = None
+        sim = pickle.load(fp)
+
+    sim.context.activate()
+    return sim
@@ -1,37 +1,13 @@
-import cv2 as cv
+import math
 import numpy as np
 
 from XdockParams import MAX_TRUCK_LOAD, TIME_DOCK_INBOUND, TIME_DOCK_OUTBOUND, TIME_LOAD_RC_TRUCK, TIME_UNLOAD_RC_TRUCK, TIME_STEP_S,\
                         BLACK
-from ModelParameters import get_log_filename
 
-from functools import update_wrapper, partial
-class TruckLogger:
-    def __init__(self, func):
-        update_wrapper(self, func)
-        self.func      = func
-        self.log_file  = ""
-
-    def __get__(self, obj, objtype):
-        return partial(self.__call__, obj)
-
-    def __call__(self, truck, *args, **kwargs):
-        result = self.func(truck, *args, **kwargs)
-
-        if self.log_file=="":
-            self.log_file = get_log_filename("Trucks")
-            dummy = Truck(0., 0., (0, 0, 0))
-            with open(self.log_file, "w") as fp:
-                fp.write(dummy._get_log_line(header=True) + '\n')
-
-        with open(self.log_file, "a") as fp:
-            fp.write(truck._get_log_line() + '\n')
-
-        return result
 
 class Truck:
-    lastID = 0
-    def __init__(self, t_arrive, t_departure, color, destination=None, prios=None, roll_containers=None, ID = None):
+    def __init__(self, t_arrive, t_departure, color, destination=None, prios=None, roll_containers=None, ID = None, context=None):
+        self.context     = context # SimulationContext, for the ID (if not given) and logging
         self.color       = color
         self.arrival     = t_arrive
         self.departure   = t_departure
@@ -44,8 +20,7 @@ class Truck:
         self.truck_load  = [] if roll_containers is None else [rol for rol in roll_containers]
 
         if ID is None:
-            self.ID         = str(Truck.lastID)
-            Truck.lastID   += 1
+            self.ID         = str(context.get_next_id("Truck"))
         else:
             self.ID         = str(ID)
 
@@ -70,6 +45,7 @@ class Truck:
         return "\t".join(kw.split('=')[h].strip() for kw in str(self).split("\n") if len(kw)>1)
 
     def draw(self, floor_plan, dock):
+        import cv2 as cv
         s = 0.2*(dock.w2-dock.w1)
         x = 0.6*dock.w1 + 0.4*dock.w2
         y = 1.1*dock.h1 - 0.1*dock.h2
@@ -106,7 +82,37 @@ class Truck:
         if self.__dock_time>=TIME_DOCK_INBOUND:
             self.__dead_time_rc += TIME_STEP_S
 
-    @TruckLogger
+    def skip_steps(self, n_step):
+        # Equivalent to n_step calls of time_step()
+        if not self.__docked: return
+
+        if self.__dock_time>=TIME_DOCK_INBOUND:
+            n_dead = n_step
+        else:
+            n_dead = max(0, n_step - math.ceil((TIME_DOCK_INBOUND-self.__dock_time)/TIME_STEP_S) + 1)
+        self.__dock_time    += n_step*TIME_STEP_S
+        self.__dead_time_rc += n_dead*TIME_STEP_S
+
+    def get_n_idle_steps(self):
+        """
+            return number of calls of time_step() before the truck can (possibly) change state:
+            undocking, end of the (un)loading window or the next roll container can be (un)loaded
+        """
+        if not self.__docked: return math.inf
+
+        t_dock = self.departure-self.arrival
+        n_step = int((t_dock-self.__dock_time)/TIME_STEP_S)
+
+        t_close = t_dock-TIME_DOCK_OUTBOUND
+        if self.__dock_time<t_close:
+            n_step = min(n_step, int((t_close-self.__dock_time)/TIME_STEP_S))
+
+        if self.__dead_time_rc<=0.:
+            t_rc   = max(self.__dock_time, TIME_DOCK_INBOUND) - self.__dead_time_rc
+            n_step = min(n_step, int((t_rc-self.__dock_time)/TIME_STEP_S))
+
+        return max(0, n_step)
+
     def start_docking(self):
         self.__docked    = True
         self.__dock_time = 0.
@@ -114,14 +120,15 @@ class Truck:
             self.__dead_time_rc = -TIME_UNLOAD_RC_TRUCK
         else:
             self.__dead_time_rc = -TIME_LOAD_RC_TRUCK
+        self.context.log_truck(self)
 
     def can_be_undocked(self):
         if not self.__docked: return False
         return self.__dock_time>=self.departure-self.arrival
 
-    @TruckLogger
     def undock(self):
         self.__docked = False
+        self.context.log_truck(self)
 
     def can_be_unloaded(self):
         if not self.__docked or not self.inbound: return False
@@ -9,16 +9,35 @@ from Truck import Truck
 from XdockParams import MAX_TRUCK_LOAD, MAX_DOCK_TIME_LOADING, MAX_DOCK_TIME_UNLOADING, MIN_DOCK_TIME_GAP
 from ModelParameters import ModelParams as M
 from RollContainer import RollContainer
+from SimulationContext import SimulationContext
 from SimulationConfig import PRIO_LIST, DESTINATIONS, destination_color_dict, get_output_dock, destination_from_dock, prio_from_dock
 
 
 class TruckPlan:
-    def __init__(self, simulate, x_dock_name="C_TL"):
+    """
+        Inbound and outbound trucks of one day with their docks. Random numbers (loads of simulated inbound trucks,
+        order of the roll containers on inbound trucks and arrival jitter) come from random streams of the plan only:
+        with the same seed, a plan is the same in every process and for every floor plan configuration.
+        seed           : None for the fixed simulated plan and an unseeded order of the loads from file
+        arrival_jitter : standard deviation (s) of a random shift of the arrival and departure of each truck
+    """
+    def __init__(self, simulate, x_dock_name="C_TL", context=None, seed=None, arrival_jitter=0.):
+        self.context    = SimulationContext() if context is None else context
+        self.context.activate()
+        if seed is None:
+            self.rng_load   = random.Random(13 if simulate else None)
+            self.rng_arrive = random.Random()
+        else:
+            load_seed, arrive_seed = np.random.SeedSequence(seed).generate_state(2).tolist()
+            self.rng_load   = random.Random(load_seed)
+            self.rng_arrive = random.Random(arrive_seed)
 
         self.truck_list = []
         if simulate: self.__simulate_truck_list()
         else:        self.__trucks_from_file(x_dock_name)
 
+        if arrival_jitter>0.:
+            self.__jitter_arrivals(arrival_jitter)
         self.__assign_docks()
 
         self.start_time = self.truck_list[0].arrival
@@ -56,18 +75,17 @@ class TruckPlan:
     def __simulate_truck_list(self):
         def create_truck(nrc, destination, t_arrive, high_prio=None):
             if destination is None:  # unloading truck
-                dest_list = random.choices(DESTINATIONS, weights=[np.exp(n*1.3) for n in range(len(DESTINATIONS))], k=nrc)
-                prio_list = random.choices(PRIO_LIST, weights=[np.exp(n*2) for n in range(len(PRIO_LIST))], k=nrc)
-                rc_list   = [RollContainer(0., 0., 3, dest, prio, destination_color_dict[dest]) for (dest, prio) in zip(dest_list, prio_list)]
+                dest_list = self.rng_load.choices(DESTINATIONS, weights=[np.exp(n*1.3) for n in range(len(DESTINATIONS))], k=nrc)
+                prio_list = self.rng_load.choices(PRIO_LIST, weights=[np.exp(n*2) for n in range(len(PRIO_LIST))], k=nrc)
+                rc_list   = [RollContainer(0., 0., 3, dest, prio, destination_color_dict[dest], self.context) for (dest, prio) in zip(dest_list, prio_list)]
                 t_depart  = t_arrive + MAX_DOCK_TIME_UNLOADING
-                return Truck(t_arrive, t_depart, (100, 100, 100), roll_containers=rc_list)
+                return Truck(t_arrive, t_depart, (100, 100, 100), roll_containers=rc_list, context=self.context)
 
             else:  # loading truck
                 prios = [PRIO_LIST[0]] if high_prio else [PRIO_LIST[1]]
                 t_depart = t_arrive + MAX_DOCK_TIME_LOADING
-                return Truck(t_arrive, t_depart, destination_color_dict[destination], destination=destination, prios=prios)
+                return Truck(t_arrive, t_depart, destination_color_dict[destination], destination=destination, prios=prios, context=self.context)
 
-        random.seed(13)
         self.truck_list = [create_truck(48, None, 0.),
                            create_truck(48, None, 0.),
                            create_truck(48, None, 60.),
@@ -110,11 +128,11 @@ class TruckPlan:
                     shift = int(li[1][:-1])
                     if dest not in DESTINATIONS or shift not in [1,2]: continue
                     prio = PRIO_LIST[0] if shift==1 else PRIO_LIST[1]
-                    rc_list.append(RollContainer(0.,0.,0, dest, prio, destination_color_dict[dest]))
+                    rc_list.append(RollContainer(0.,0.,0, dest, prio, destination_color_dict[dest], self.context))
 
-                random.shuffle(rc_list)
+                self.rng_load.shuffle(rc_list)
                 t_depart = t_arrive + MAX_DOCK_TIME_UNLOADING
-                self.truck_list.append( Truck(t_arrive, t_depart, (100, 100, 100), roll_containers=rc_list, ID=row["trip"]))
+                self.truck_list.append( Truck(t_arrive, t_depart, (100, 100, 100), roll_containers=rc_list, ID=row["trip"], context=self.context))
                 n_in +=1
 
             elif row.IO=="out_bound" and n_out<=max_out:
@@ -123,12 +141,19 @@ class TruckPlan:
                 if dest not in DESTINATIONS or shift not in [1,2]: continue
                 prios    = [PRIO_LIST[0]] if shift==1 else [PRIO_LIST[1]]
                 t_depart = t_arrive + MAX_DOCK_TIME_LOADING
-                self.truck_list.append(Truck(t_arrive, t_depart, destination_color_dict[dest], destination=dest, prios=prios, ID=row["trip"]))
+                self.truck_list.append(Truck(t_arrive, t_depart, destination_color_dict[dest], destination=dest, prios=prios, ID=row["trip"], context=self.context))
                 n_out +=1
 
             if n_in>max_in and n_out>max_out:
                 break
 
+    def __jitter_arrivals(self, sigma):
+        # Shift each truck by a normal distributed time, keeping its time at the dock
+        for truck in self.truck_list:
+            shift            = self.rng_arrive.gauss(0., sigma)
+            truck.arrival   += shift
+            truck.departure += shift
+
     def __assign_docks(self):
         """
             Preliminary dock assignment.
@@ -48,6 +48,7 @@ MAX_DOCK_TIME_UNLOADING  = TIME_DOCK_INBOUND + MAX_TRUCK_LOAD * TIME_UNLOAD_RC_T
 
 # Logging
 LOG_INTERVAL_ROBOT       = 60.
+LOG_INTERVAL_STORE       = 60.
 
 # General
 EPS   = 1.e-6